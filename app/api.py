@@ -0,0 +1,204 @@
+import io
+import os
+import json
+import difflib
+from contextlib import redirect_stdout
+from app import config as app_config
+from app.filesystem import VirtualFilesystem
+from app.generators import GENERATORS
+from app.profiler import Profiler
+from app.schema import ConfigValidationError
+from app.template import TemplateParser
+
+
+class GenerationResult(object):
+    """The outcome of generating a config through the python API
+
+    files: the rendered template files, each with its destination, template and contents
+    patches: the code rendered for the dynamic files, each with its destination, template, tag and contents
+    patched_files: given a project, the contents of each dynamic file with the patches applied, and a diff of them
+    errors: the problems found, each with the stage it was found in and a message
+    timings: the time spent in each generation stage, and the cache counters, as Profiler.get_results
+    output: given write, the messages the generator printed
+    """
+
+    def __init__(self):
+        self.files = []
+        self.patches = []
+        self.patched_files = []
+        self.errors = []
+        self.timings = {}
+        self.output = ''
+
+    @property
+    def success(self) -> bool:
+        return len(self.errors) == 0
+
+    def add_error(self, stage: str, message: str, **details) -> None:
+        error = {'stage': stage, 'message': message}
+        error.update(details)
+
+        self.errors.append(error)
+
+    def to_dict(self) -> dict:
+        """Returns the result as plain data, which can be encoded as JSON"""
+        return {
+            'success': self.success,
+            'files': self.files,
+            'patches': self.patches,
+            'patched_files': self.patched_files,
+            'errors': self.errors,
+            'timings': self.timings,
+            'output': self.output,
+        }
+
+
+def generate(config, kind: str = 'module', project: str = None, write: bool = False, options: list = None, fix_cs: bool = False) -> GenerationResult:
+    """Generates a config in memory, for test suites and services running the generator in process
+
+    Nothing is written and no formatters are run unless write is given. Every template is
+    rendered even when others fail, so the result reports all of the errors at once.
+
+    :param config: the config, or the path of a config file
+    :param kind: the type of config, one of the keys of GENERATORS ("module" or "page")
+    :param project: the project directory, to apply the patches to its dynamic files in memory
+    :param write: generate the files into the project, as the generate:* commands do
+    :param options: the command line options to generate with, given write (e.g. ["--overwrite"])
+    :param fix_cs: run the formatters over the written files, given write
+    :return: the rendered files, patches, errors and timings
+    """
+    if kind not in GENERATORS:
+        raise(Exception('The kind of config must be one of: %s' % ', '.join(GENERATORS)))
+
+    generator = GENERATORS[kind]
+    result = GenerationResult()
+
+    Profiler.reset()
+
+    try:
+        config_dict = generator.parse_config(_load_config(config))
+    except ConfigValidationError as exception:
+        for message in exception.errors:
+            result.add_error('config', message)
+    except Exception as exception:
+        result.add_error('config', str(exception))
+
+    if result.success:
+        _render(generator, config_dict, result)
+
+    if result.success and project is not None:
+        _patch_project(project, result)
+
+    if result.success and write:
+        _write(generator, config_dict, project or os.getcwd(), options or [], fix_cs, result)
+
+    result.timings = Profiler.get_results()
+
+    return result
+
+
+def _load_config(config) -> dict:
+    if isinstance(config, str):
+        with open(config, 'r') as config_file:
+            return json.loads(config_file.read())
+
+    if not isinstance(config, dict):
+        raise(Exception('The config must be a dict or a file path.'))
+
+    return config
+
+
+def _render(generator, config_dict: dict, result: GenerationResult) -> None:
+    """Renders the template files and dynamic file patches of a parsed config into the result"""
+    # The render cache lives in the cache directory, so it isn't written to
+    parser = TemplateParser(config_dict, use_cache=False)
+
+    try:
+        outputs = generator.get_outputs(parser)
+    except Exception as exception:
+        result.add_error('render', str(exception))
+        return
+
+    for output in outputs:
+        try:
+            output['contents'] = parser.render_file(output['template'])
+        except Exception as exception:
+            result.add_error('render', str(exception), template=output['template'])
+            continue
+
+        if 'tag' in output:
+            result.patches.append(output)
+        else:
+            result.files.append(output)
+
+
+def _patch_project(project: str, result: GenerationResult) -> None:
+    """Applies the patches to the dynamic files of a project in memory, leaving the project untouched"""
+    filesystem = VirtualFilesystem(os.path.join(project, app_config.STAGING_DIR))
+    destinations = []
+
+    for patch in result.patches:
+        file_path = os.path.join(project, patch['destination'])
+
+        try:
+            if not os.path.isfile(file_path):
+                raise(Exception('Couldn\'t find the file "%s" to update.' % patch['destination']))
+
+            filesystem.insert(file_path, {patch['tag']: patch['contents']})
+        except Exception as exception:
+            result.add_error('update', str(exception), destination=patch['destination'], tag=patch['tag'])
+            continue
+
+        if patch['destination'] not in destinations:
+            destinations.append(patch['destination'])
+
+    for destination in destinations:
+        file_path = os.path.join(project, destination)
+
+        with open(file_path, 'r') as project_file:
+            current_contents = project_file.read()
+
+        patched_contents = filesystem.read(file_path)
+
+        result.patched_files.append({
+            'destination': destination,
+            'contents': patched_contents,
+            'diff': ''.join(difflib.unified_diff(
+                current_contents.splitlines(True),
+                patched_contents.splitlines(True),
+                fromfile='a/' + destination,
+                tofile='b/' + destination,
+            )),
+        })
+
+
+def _write(generator, config_dict: dict, project: str, options: list, fix_cs: bool, result: GenerationResult) -> None:
+    """Generates the parsed config into the project, capturing the generator's output"""
+    args = list(options)
+
+    # The formatters run as subprocesses, so they're only run when asked for
+    if not fix_cs and '--skip-cs-fix' not in args:
+        args.append('--skip-cs-fix')
+
+    output = io.StringIO()
+    errors = []
+    working_directory = os.getcwd()
+
+    try:
+        os.chdir(project)
+
+        with redirect_stdout(output):
+            success = generator.build_config(config_dict, args, errors=errors)
+    except Exception as exception:
+        success = False
+        errors.append({'stage': 'write', 'message': str(exception)})
+    finally:
+        os.chdir(working_directory)
+
+    result.output = output.getvalue()
+
+    for error in errors:
+        result.add_error(**error)
+
+    if not success and len(errors) == 0:
+        result.add_error('write', 'The generation failed, see the output for details.')
@@ -0,0 +1,150 @@
+import os
+import glob
+import json
+import time
+from app import config
+from app.filters import TemplateFilters
+from app.formatter import CodeFormatter
+from app.generators import ModuleGenerator
+from app.generators import PageGenerator
+from app.manifest import GenerationManifest
+from app.markers import MarkerIndex
+from app.profiler import Profiler
+
+
+class BatchGenerator(object):
+
+    @classmethod
+    def build(cls, sources: list, args: list) -> bool:
+        """Builds every module and page config matched by the provided manifests or glob patterns
+
+        All configs are generated in this process, sharing the template environment and
+        schema validators, and the touched files are formatted once after the final config.
+
+        :param sources: paths to batch manifests, config files or glob patterns of config files
+        :param args: the command line options to pass to each generator
+        :return: if every config was generated successfully
+        """
+        try:
+            jobs = cls.collect_jobs(sources)
+        except Exception as exception:
+            print('Could not read the batch sources, aborting:\n\n%s' % str(exception))
+            return False
+
+        if len(jobs) == 0:
+            print('No configs matched the provided batch sources.')
+            return False
+
+        # Format every touched file together once all configs are generated
+        formatter = CodeFormatter()
+        manifest = GenerationManifest(config.MANIFEST_PATH)
+
+        results = []
+        started_at = time.time()
+
+        for (index, (generator, config_path)) in enumerate(jobs):
+            print('\n[%d/%d] %s' % (index + 1, len(jobs), config_path))
+
+            results.append(
+                (config_path, generator.build(config_path, args, formatter, manifest))
+            )
+
+        # A dry run leaves the project, and so the manifest, untouched
+        if not "--dry-run" in args:
+            if not "--skip-cs-fix" in args:
+                print('\nFixing cs...')
+                formatter.run()
+
+            manifest.save()
+            MarkerIndex.save()
+            TemplateFilters.save()
+
+        failed_paths = [path for (path, success) in results if not success]
+
+        print('\nGenerated %d of %d config(s) in %.2fs.' % (
+            len(results) - len(failed_paths), len(results), time.time() - started_at
+        ))
+
+        for failed_path in failed_paths:
+            print(' - failed: %s' % failed_path)
+
+        Profiler.report(args)
+
+        return len(failed_paths) == 0
+
+    @classmethod
+    def collect_jobs(cls, sources: list) -> list:
+        """Expands the provided sources into the configs to generate
+
+        :return: a nested array containing the generator and config path of each job
+        """
+        jobs = []
+
+        for source in sources:
+            if os.path.isfile(source) and cls.__is_manifest(source):
+                jobs += cls.__read_manifest(source)
+                continue
+
+            matched_paths = sorted(glob.glob(source))
+
+            if len(matched_paths) == 0:
+                raise(Exception('No files matched "%s".' % source))
+
+            for config_path in matched_paths:
+                jobs.append([cls.__detect_generator(config_path), config_path])
+
+        return jobs
+
+    @classmethod
+    def __is_manifest(cls, file_path: str) -> bool:
+        with open(file_path, 'r') as source_file:
+            try:
+                contents = json.loads(source_file.read())
+            except ValueError:
+                return False
+
+        return isinstance(contents, dict) and (
+            'modules' in contents or 'pages' in contents
+        )
+
+    @classmethod
+    def __read_manifest(cls, manifest_path: str) -> list:
+        """Reads a manifest listing module and page configs, relative to the manifest
+
+        :return: a nested array containing the generator and config path of each job
+        """
+        with open(manifest_path, 'r') as manifest_file:
+            manifest = json.loads(manifest_file.read())
+
+        manifest_directory = os.path.dirname(manifest_path)
+        jobs = []
+
+        for (key, generator) in [('modules', ModuleGenerator), ('pages', PageGenerator)]:
+            for pattern in manifest.get(key, []):
+                matched_paths = sorted(
+                    glob.glob(os.path.join(manifest_directory, pattern))
+                )
+
+                if len(matched_paths) == 0:
+                    raise(Exception('No files matched "%s" in manifest %s.' %
+                                    (pattern, manifest_path)))
+
+                for config_path in matched_paths:
+                    jobs.append([generator, config_path])
+
+        return jobs
+
+    @classmethod
+    def __detect_generator(cls, config_path: str):
+        """Page template configs are identified by their required "id" key"""
+        with open(config_path, 'r') as config_file:
+            try:
+                config_dict = json.loads(config_file.read())
+            except ValueError:
+                # Let the generator report the invalid config
+                return ModuleGenerator
+
+        if isinstance(config_dict, dict) and 'id' in config_dict:
+            return PageGenerator
+
+        return ModuleGenerator
@@ -0,0 +1,202 @@
+import os
+import shutil
+import hashlib
+from app import config
+from app.filters import TemplateFilters
+from app.profiler import Profiler
+
+
+class RenderCache(object):
+
+    # Fraction of the size limit to evict down to, so eviction doesn't run on every write
+    EVICTION_TARGET = 0.9
+
+    __total_size = None
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return config.RENDER_CACHE_SIZE > 0
+
+    @classmethod
+    def get_key(cls, template_hash: str, input_hash: str) -> str:
+        """Identifies a rendered template by the hashes of everything that determines its output
+
+        :param template_hash: the hash of the template's source
+        :param input_hash: the hash of the parts of the config the template reads
+        """
+        return hashlib.sha1(
+            ('%s:%s:%d' % (template_hash, input_hash, TemplateFilters.VERSION)).encode('utf-8')
+        ).hexdigest()
+
+    @classmethod
+    def get(cls, key: str) -> str:
+        """Returns the cached output for the key, marking it as recently used
+
+        :return: the rendered template, or None if it isn't cached
+        """
+        entry_path = cls.__get_entry_path(key)
+
+        try:
+            with open(entry_path, 'r') as entry_file:
+                contents = entry_file.read()
+
+            os.utime(entry_path)
+        except OSError:
+            Profiler.count('render cache')
+            return None
+
+        Profiler.count('render cache', hit=True)
+
+        return contents
+
+    @classmethod
+    def put(cls, key: str, contents: str) -> None:
+        """Caches a rendered template, evicting the least recently used entries if the cache is full"""
+        def write_entry(temporary_path: str) -> None:
+            with open(temporary_path, 'w') as entry_file:
+                entry_file.write(contents)
+
+        cls.__store(key, write_entry)
+
+    @classmethod
+    def put_file(cls, key: str, file_path: str) -> None:
+        """Caches a template which was rendered to a file, without reading it into memory"""
+        cls.__store(key, lambda temporary_path: shutil.copyfile(file_path, temporary_path))
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        entries = cls.__list_entries()
+
+        return {
+            'entries': len(entries),
+            'size': sum(size for (entry_path, size, used_at) in entries),
+            'limit': config.RENDER_CACHE_SIZE,
+            'bytecode_files': len(cls.__list_files(cls.__get_bytecode_directory())),
+            'filter_cache': os.path.isfile(cls.__get_filter_cache_path()),
+        }
+
+    @classmethod
+    def clear(cls) -> None:
+        """Removes every rendered template, compiled template bytecode and filter result from the cache"""
+        for directory in [cls.__get_directory(), cls.__get_bytecode_directory()]:
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+
+        if os.path.isfile(cls.__get_filter_cache_path()):
+            os.remove(cls.__get_filter_cache_path())
+
+        cls.__total_size = 0
+
+    @classmethod
+    def run_command(cls, action: str) -> None:
+        """Runs the cache command, either "stats" or "clear" """
+        if action == 'clear':
+            cls.clear()
+            return print('Cleared the cache in %s.' % config.CACHE_DIR)
+
+        if action != 'stats':
+            return print('Sorry, the cache command only supports "stats" and "clear".')
+
+        stats = cls.get_stats()
+
+        print('Cache directory:    %s' % config.CACHE_DIR)
+        print('Rendered templates: %d (%.1f of %.1f MB)' % (
+            stats['entries'], stats['size'] / 1048576, stats['limit'] / 1048576
+        ))
+        print('Compiled templates: %d' % stats['bytecode_files'])
+        print('Filter results:     %s' % ('cached' if stats['filter_cache'] else 'not cached'))
+
+    @classmethod
+    def __store(cls, key: str, write_entry) -> None:
+        entry_path = cls.__get_entry_path(key)
+        temporary_path = '%s.%d.tmp' % (entry_path, os.getpid())
+
+        # Measure the cache before the entry is written, so it's only counted once
+        total_size = cls.__get_total_size()
+
+        # Other processes may be reading the same entry, so it's only ever replaced whole
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            write_entry(temporary_path)
+
+            # An entry being replaced no longer counts towards the size of the cache
+            replaced_size = os.path.getsize(entry_path) if os.path.isfile(entry_path) else 0
+
+            os.replace(temporary_path, entry_path)
+        except OSError:
+            return
+
+        cls.__total_size = total_size - replaced_size + os.path.getsize(entry_path)
+
+        if cls.__total_size > config.RENDER_CACHE_SIZE:
+            cls.__evict()
+
+    @classmethod
+    def __evict(cls) -> None:
+        """Removes the least recently used entries until the cache is below its size limit"""
+        entries = sorted(cls.__list_entries(), key=lambda entry: entry[2])
+        total_size = sum(size for (entry_path, size, used_at) in entries)
+
+        for (entry_path, size, used_at) in entries:
+            if total_size <= config.RENDER_CACHE_SIZE * cls.EVICTION_TARGET:
+                break
+
+            try:
+                os.remove(entry_path)
+            except OSError:
+                # Another process evicted it first
+                pass
+
+            total_size -= size
+
+        cls.__total_size = total_size
+
+    @classmethod
+    def __get_total_size(cls) -> int:
+        """Returns the size of the cache, measured once per process and then kept up to date"""
+        if cls.__total_size is None:
+            cls.__total_size = sum(size for (entry_path, size, used_at) in cls.__list_entries())
+
+        return cls.__total_size
+
+    @classmethod
+    def __list_entries(cls) -> list:
+        """Returns the path, size and time of last use of every cached render"""
+        return [
+            entry for entry in cls.__list_files(cls.__get_directory())
+            if not entry[0].endswith('.tmp')
+        ]
+
+    @classmethod
+    def __list_files(cls, directory: str) -> list:
+        files = []
+
+        for (current_directory, directories, file_names) in os.walk(directory):
+            for file_name in file_names:
+                file_path = os.path.join(current_directory, file_name)
+
+                try:
+                    file_stat = os.stat(file_path)
+                except OSError:
+                    continue
+
+                files.append((file_path, file_stat.st_size, file_stat.st_mtime))
+
+        return files
+
+    @classmethod
+    def __get_entry_path(cls, key: str) -> str:
+        # Spread the entries over subdirectories to keep directory listings short
+        return os.path.join(cls.__get_directory(), key[:2], key)
+
+    @classmethod
+    def __get_directory(cls) -> str:
+        return os.path.join(config.CACHE_DIR, 'renders')
+
+    @classmethod
+    def __get_bytecode_directory(cls) -> str:
+        return os.path.join(config.CACHE_DIR, 'bytecode')
+
+    @classmethod
+    def __get_filter_cache_path(cls) -> str:
+        return os.path.join(config.CACHE_DIR, 'filters.json')
@@ -1,18 +1,97 @@
+import os
 import sys
-from app.generators import ModuleGenerator, PageGenerator
-
+# Commands are resolved to their handler ("module:attribute") only when dispatched,
+# so the generators and their dependencies are imported only when they're needed
 COMMANDS = [
     {
         'min_arg_count': 1,
         'name': 'generate:module',
-        'callback': lambda args: ModuleGenerator().build(args[1], args[1:])
+        'handler': 'app.generators:ModuleGenerator',
+        'callback': lambda handler, args: handler().build(args[1], args[1:])
     },
     {
         'min_arg_count': 1,
         'name': 'generate:page',
-        'callback': lambda args: PageGenerator().build(args[1], args[1:])
+        'handler': 'app.generators:PageGenerator',
+        'callback': lambda handler, args: handler().build(args[1], args[1:])
+    },
+    {
+        'min_arg_count': 1,
+        'name': 'generate:batch',
+        'handler': 'app.batch:BatchGenerator',
+        'callback': lambda handler, args: handler().build(
+            [arg for arg in args[1:] if not arg.startswith('--')],
+            [arg for arg in args[1:] if arg.startswith('--')]
+        )
+    },
+    {
+        'min_arg_count': 1,
+        'name': 'watch',
+        'handler': 'app.watcher:Watcher',
+        'callback': lambda handler, args: handler().watch(
+            [arg for arg in args[1:] if not arg.startswith('--')],
+            [arg for arg in args[1:] if arg.startswith('--')]
+        )
+    },
+    {
+        'min_arg_count': 0,
+        'name': 'serve',
+        'handler': 'app.server:RpcServer',
+        'callback': lambda handler, args: handler().serve(sys.stdin, sys.stdout)
+    },
+    {
+        'min_arg_count': 0,
+        'name': 'templates:compile',
+        'handler': 'app.template:TemplateParser',
+        'callback': lambda handler, args: handler.compile_templates('--zip' in args)
+    },
+    {
+        'min_arg_count': 0,
+        'name': 'markers',
+        'handler': 'app.markers:MarkerIndex',
+        'callback': lambda handler, args: handler.list_markers(args[1] if len(args) > 1 else '.')
+    },
+    {
+        'min_arg_count': 1,
+        'name': 'cache',
+        'handler': 'app.cache:RenderCache',
+        'callback': lambda handler, args: handler.run_command(args[1])
     }
 ]
 
 # Directory to load templates from (no trailing slash)
-TEMPLATE_DIR = sys.path[0] + '/templates'
+TEMPLATE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'templates'
+)
+
+# Path the templates:compile command writes the compiled templates to, as a directory or with a .zip extension
+COMPILED_TEMPLATE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'build',
+    'templates'
+)
+
+# Directory to store generator caches in, such as compiled template bytecode
+CACHE_DIR = os.environ.get(
+    'OPTIMUS_CLI_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'optimus-cli')
+)
+
+# Maximum size in bytes of the rendered templates kept in the cache directory, 0 disables the render cache
+RENDER_CACHE_SIZE = int(os.environ.get('OPTIMUS_CLI_RENDER_CACHE_SIZE', 64 * 1024 * 1024))
+
+# Whether the results of the slower template filters, such as plural, are kept in the cache directory between runs
+PERSIST_FILTER_CACHE = os.environ.get('OPTIMUS_CLI_PERSIST_FILTER_CACHE', '1') != '0'
+
+# Project file recording the inputs and outputs of previous generations
+MANIFEST_PATH = '.optimus-cli/manifest.json'
+
+# Project directory rendered files are staged in until every file of a generation is ready
+STAGING_DIR = '.optimus-cli/staging'
+
+# Project file recording the marker tags found in project files, with the size and mtime they were scanned at
+MARKER_INDEX_PATH = '.optimus-cli/markers.json'
+
+# Project directory holding the lock files which stop concurrent generations losing each other's updates
+LOCK_DIR = '.optimus-cli/locks'
@@ -0,0 +1,267 @@
+import json
+import hashlib
+from jinja2 import nodes
+
+
+class TemplateDependencies(object):
+    """Finds the parts of the config each template reads, so a template is only re-rendered when they change
+
+    Dependencies are paths into the template context, e.g. ("fields", "[]", "label") for the
+    label of every field, ("fields", "#") for the number of fields, ("index", "names") for the
+    module names, ("has_feature", "sort") for a call to has_feature('sort') and
+    ("partials", "module/front/fields") for the field partials rendered by render_fields.
+    Anything the analysis can't follow depends on the whole config.
+    """
+
+    # Path depending on the whole config
+    EVERYTHING = ('*',)
+
+    # Features checked by the helpers which take no arguments
+    HELPER_FEATURES = {
+        'get_model_parents': ['menu', 'sort'],
+        'get_model_traits': ['draft', 'slug', 'media', 'seo', 'menu', 'sort'],
+    }
+
+    # Helpers which only depend on their arguments
+    PURE_HELPERS = ['in_array']
+
+    # Helpers which render every field through the partials in the directory they're given
+    PARTIAL_HELPERS = ['render_fields']
+
+    # Marks names bound by the template itself, such as macros, macro arguments and the loop variable
+    __LOCAL = ()
+
+    __analyses = {}
+
+    @classmethod
+    def get(cls, environment, template_name: str, template_hash: str) -> list:
+        """Returns the sorted dependency paths of a template, analysing it once per version of its source"""
+        if (template_name, template_hash) not in cls.__analyses:
+            source = environment.loader.get_source(environment, template_name)[0]
+
+            cls.__analyses[(template_name, template_hash)] = cls.analyse(environment, source)
+
+        return cls.__analyses[(template_name, template_hash)]
+
+    @classmethod
+    def add(cls, template_name: str, template_hash: str, dependencies: list) -> None:
+        """Records dependency paths analysed ahead of time, such as when the templates were precompiled"""
+        cls.__analyses[(template_name, template_hash)] = dependencies
+
+    @classmethod
+    def analyse(cls, environment, source: str) -> list:
+        """Statically analyses a template's source
+
+        :return: the sorted dependency paths of the template
+        """
+        template = environment.parse(source)
+        dependencies = set()
+
+        # Macros can be called before the point they're defined at
+        scope = {
+            macro.name: cls.__LOCAL for macro in template.find_all(nodes.Macro)
+        }
+
+        for node in template.body:
+            cls.__visit(node, scope, dependencies)
+
+        if cls.EVERYTHING in dependencies:
+            return [cls.EVERYTHING]
+
+        return sorted(dependencies)
+
+    @classmethod
+    def fingerprint(cls, dependencies: list, config_dict: dict, index: dict, partial_hashes: dict = None) -> str:
+        """Hashes the parts of the config a template depends on
+
+        :param dependencies: the dependency paths of the template
+        :param config_dict: the parsed config
+        :param index: the index of the config
+        :param partial_hashes: the hash of the partials in each directory the template renders fields with
+        :return: a hash which only changes when the template's output could
+        """
+        if dependencies == [cls.EVERYTHING]:
+            values = config_dict
+        else:
+            values = [
+                [list(path), cls.__project(cls.__get_root(path, config_dict, index, partial_hashes), path[1:])]
+                for path in dependencies
+            ]
+
+        return hashlib.sha1(
+            json.dumps(values, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+
+    @classmethod
+    def __get_root(cls, path: tuple, config_dict: dict, index: dict, partial_hashes: dict):
+        if path[0] == 'index':
+            return index
+
+        if path[0] == 'partials':
+            return partial_hashes or {}
+
+        if path[0] == 'has_feature':
+            return {path[1]: path[1] in index['features']}
+
+        return config_dict.get(path[0])
+
+    @classmethod
+    def __project(cls, value, path: tuple):
+        """Picks the values at the path out of a config value, keeping the whole value where the path can't be followed"""
+        if len(path) == 0:
+            return value
+
+        if path[0] == '#':
+            return len(value) if isinstance(value, (list, tuple, dict)) else value
+
+        if path[0] == '[]':
+            if not isinstance(value, (list, tuple)):
+                return value
+
+            return [cls.__project(item, path[1:]) for item in value]
+
+        if not isinstance(value, dict):
+            return value
+
+        return cls.__project(value.get(path[0]), path[1:])
+
+    @classmethod
+    def __visit(cls, node, scope: dict, dependencies: set) -> None:
+        if isinstance(node, (nodes.Name, nodes.Getattr, nodes.Getitem)):
+            path = cls.__resolve(node, scope)
+
+            if path is not None:
+                if path != cls.__LOCAL:
+                    dependencies.add(path)
+
+                # Computed keys are lookups of their own
+                for lookup in [node] + list(node.find_all(nodes.Getitem)):
+                    if isinstance(lookup, nodes.Getitem) and not isinstance(lookup.arg, nodes.Const):
+                        cls.__visit(lookup.arg, scope, dependencies)
+
+                return
+
+        if isinstance(node, nodes.Call) and isinstance(node.node, nodes.Name) and node.node.name not in scope:
+            return cls.__visit_helper_call(node, scope, dependencies)
+
+        if isinstance(node, nodes.For):
+            return cls.__visit_for(node, scope, dependencies)
+
+        if isinstance(node, nodes.Macro):
+            macro_scope = dict(scope)
+
+            for argument in node.args:
+                macro_scope[argument.name] = cls.__LOCAL
+
+            for default in node.defaults:
+                cls.__visit(default, scope, dependencies)
+
+            for child in node.body:
+                cls.__visit(child, macro_scope, dependencies)
+
+            return
+
+        if isinstance(node, nodes.Assign) and isinstance(node.target, nodes.Name):
+            path = cls.__resolve(node.node, scope)
+
+            # Aliases of config values are followed, anything else assigned is the template's own
+            if path is None:
+                cls.__visit(node.node, scope, dependencies)
+
+            scope[node.target.name] = cls.__LOCAL if path is None else path
+
+            return
+
+        # Other templates, and assignments which can't be followed, could read anything
+        if isinstance(node, (nodes.Include, nodes.Import, nodes.FromImport, nodes.Extends, nodes.Assign, nodes.AssignBlock)):
+            dependencies.add(cls.EVERYTHING)
+            return
+
+        for child in node.iter_child_nodes():
+            cls.__visit(child, scope, dependencies)
+
+    @classmethod
+    def __visit_helper_call(cls, node, scope: dict, dependencies: set) -> None:
+        helper = node.node.name
+
+        if helper == 'has_feature':
+            if len(node.args) == 1 and isinstance(node.args[0], nodes.Const):
+                dependencies.add(('has_feature', node.args[0].value))
+            else:
+                dependencies.add(('index', 'features'))
+        elif helper in cls.PARTIAL_HELPERS:
+            if len(node.args) == 1 and isinstance(node.args[0], nodes.Const):
+                # The partials can read any of a field's options
+                dependencies.add(('fields',))
+                dependencies.add(('partials', node.args[0].value))
+            else:
+                dependencies.add(cls.EVERYTHING)
+        elif helper in cls.HELPER_FEATURES:
+            for feature_type in cls.HELPER_FEATURES[helper]:
+                dependencies.add(('has_feature', feature_type))
+        elif helper not in cls.PURE_HELPERS:
+            # Jinja's own globals, such as range, only depend on their arguments too
+            dependencies.add((helper,))
+
+        for child in node.iter_child_nodes():
+            if child is not node.node:
+                cls.__visit(child, scope, dependencies)
+
+    @classmethod
+    def __visit_for(cls, node, scope: dict, dependencies: set) -> None:
+        path = cls.__resolve(node.iter, scope)
+        loop_scope = dict(scope)
+        loop_scope['loop'] = cls.__LOCAL
+
+        if path is None:
+            cls.__visit(node.iter, scope, dependencies)
+        elif path != cls.__LOCAL:
+            # The number of items matters even if none of their values are used
+            dependencies.add(path + ('#',))
+
+        if isinstance(node.target, nodes.Name):
+            if path is None or path == cls.__LOCAL:
+                loop_scope[node.target.name] = cls.__LOCAL
+            else:
+                loop_scope[node.target.name] = path + ('[]',)
+        else:
+            # Unpacked items can't be followed, so depend on the whole of each item
+            if path is not None and path != cls.__LOCAL:
+                dependencies.add(path)
+
+            for target in node.target.find_all(nodes.Name):
+                loop_scope[target.name] = cls.__LOCAL
+
+        for child in node.body + node.else_ + ([node.test] if node.test is not None else []):
+            cls.__visit(child, loop_scope, dependencies)
+
+    @classmethod
+    def __resolve(cls, node, scope: dict):
+        """Resolves a variable lookup to its path in the template context
+
+        :return: the path, __LOCAL for the template's own variables, or None if the node isn't a lookup
+        """
+        if isinstance(node, nodes.Name):
+            return scope.get(node.name, (node.name,))
+
+        if isinstance(node, nodes.Getattr):
+            base_path = cls.__resolve(node.node, scope)
+
+            if base_path is None or base_path == cls.__LOCAL:
+                return base_path
+
+            return base_path + (node.attr,)
+
+        if isinstance(node, nodes.Getitem):
+            base_path = cls.__resolve(node.node, scope)
+
+            if base_path is None or base_path == cls.__LOCAL:
+                return base_path
+
+            if isinstance(node.arg, nodes.Const) and isinstance(node.arg.value, str):
+                return base_path + (node.arg.value,)
+
+            # A computed key could be anything in the value
+            return base_path
+
+        return None
@@ -0,0 +1,262 @@
+import os
+import difflib
+import shutil
+from app.lock import FileLock
+from app.markers import MarkerIndex
+
+
+class ProjectFileError(Exception):
+
+    def __init__(self, message: str, file_path: str):
+        super().__init__(message)
+        self.file_path = file_path
+
+
+class VirtualFilesystem(object):
+
+    def __init__(self, staging_directory: str):
+        # Each generation stages into its own directory, so concurrent generations never remove each other's
+        self.__staging_directory = os.path.join(staging_directory, '%d-%d' % (os.getpid(), id(self)))
+        self.__staged_files = {}
+        self.__staged_count = 0
+
+    def get_staging_path(self, file_path: str) -> str:
+        """Returns an absolute path to stream the new contents of a project file to before it's staged
+
+        :param file_path: the project file the contents are for
+        :return: a path inside the staging directory
+        """
+        os.makedirs(self.__staging_directory, exist_ok=True)
+
+        self.__staged_count += 1
+
+        return os.path.abspath(os.path.join(
+            self.__staging_directory,
+            '%d-%s' % (self.__staged_count, os.path.basename(file_path))
+        ))
+
+    def stage(self, file_path: str, staging_path: str) -> None:
+        """Stages the contents already written to a staging path as the new contents of a project file"""
+        self.__unstage(file_path)
+        self.__staged_files[file_path] = {'staging_path': staging_path}
+
+    def write(self, file_path: str, contents: str) -> None:
+        """Stages new contents for a project file in memory"""
+        self.__unstage(file_path)
+        self.__staged_files[file_path] = {'contents': contents}
+
+    def insert(self, file_path: str, insertions: dict) -> None:
+        """Queues code to insert at the marker tags of an existing project file
+
+        The insertions are applied to the file as it is when the changes are committed,
+        so updates made to it by other generator processes in the meantime aren't lost.
+        Insertions at a tag which already has queued code are merged into it, at the
+        marker tag the queued code carries.
+
+        :param file_path: the project file to update
+        :param insertions: the code to insert, by tag
+        :raises Exception: if a tag isn't in the file exactly once
+        """
+        staged_file = self.__staged_files.get(file_path)
+
+        # Files with staged contents are written whole, so the code can be inserted straight away
+        if staged_file is not None and 'insertions' not in staged_file:
+            return self.write(file_path, self.__apply_insertions(
+                file_path, self.read(file_path), None, insertions
+            )[0])
+
+        queued_insertions = {} if staged_file is None else dict(staged_file['insertions'])
+
+        for (tag, inserted_contents) in insertions.items():
+            if tag in queued_insertions:
+                inserted_contents = self.__apply_insertions(
+                    file_path, queued_insertions[tag], None, {tag: inserted_contents}
+                )[0]
+
+            queued_insertions[tag] = inserted_contents
+
+        # Check the tags against the file now, rather than only once the changes are committed
+        with open(file_path, 'r') as project_file:
+            contents = project_file.read()
+
+        self.__apply_insertions(
+            file_path, contents, MarkerIndex.get_markers(file_path, contents), queued_insertions
+        )
+
+        if staged_file is None:
+            self.__staged_files[file_path] = {'insertions': queued_insertions}
+        else:
+            staged_file['insertions'] = queued_insertions
+
+    def read(self, file_path: str) -> str:
+        """Reads a project file, as it will be once the staged changes are committed"""
+        staged_file = self.__staged_files.get(file_path)
+
+        if staged_file is not None and 'contents' in staged_file:
+            return staged_file['contents']
+
+        if staged_file is not None and 'insertions' in staged_file:
+            with open(file_path, 'r') as project_file:
+                contents = project_file.read()
+
+            return self.__apply_insertions(
+                file_path, contents, MarkerIndex.get_markers(file_path, contents), staged_file['insertions']
+            )[0]
+
+        read_path = file_path if staged_file is None else staged_file['staging_path']
+
+        with open(read_path, 'r') as project_file:
+            return project_file.read()
+
+    def isfile(self, file_path: str) -> bool:
+        return file_path in self.__staged_files or os.path.isfile(file_path)
+
+    def isdir(self, directory: str) -> bool:
+        return os.path.isdir(directory) or any(
+            os.path.dirname(file_path) == directory for file_path in self.__staged_files
+        )
+
+    def get_paths(self) -> list:
+        """Returns the paths of every project file with staged changes, in the order they were staged"""
+        return list(self.__staged_files)
+
+    def commit(self) -> list:
+        """Writes every staged change to the project
+
+        All directories are created before any file is written, and each file is
+        replaced atomically by renaming its new contents into place. Files with queued
+        insertions are locked, then read again and updated while the lock is held.
+
+        :raises Exception: if a marker tag was removed from a file since the insertions were queued, before anything is written
+        :return: the paths of the files which were written
+        """
+        updated_paths = [
+            file_path for (file_path, staged_file) in self.__staged_files.items() if 'insertions' in staged_file
+        ]
+
+        with FileLock(updated_paths):
+            self.__write_staged_files()
+
+        committed_paths = self.get_paths()
+
+        self.__staged_files = {}
+        self.__remove_staging_directory()
+
+        return committed_paths
+
+    def __write_staged_files(self) -> None:
+        for (file_path, staged_file) in self.__staged_files.items():
+            if 'insertions' in staged_file:
+                with open(file_path, 'r') as project_file:
+                    contents = project_file.read()
+
+                # Indexed markers are only reused if they're still at their offsets in the file as read under the lock
+                (staged_file['contents'], staged_file['markers']) = self.__apply_insertions(
+                    file_path, contents, MarkerIndex.get_markers(file_path, contents), staged_file['insertions']
+                )
+
+        directories = set(
+            os.path.dirname(file_path) for file_path in self.__staged_files
+        )
+
+        # Other processes may be creating the same directories
+        for directory in sorted(directories):
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        for (file_path, staged_file) in self.__staged_files.items():
+            staging_path = staged_file.get('staging_path')
+
+            if staging_path is None:
+                staging_path = os.path.join(
+                    os.path.dirname(file_path),
+                    '.%s.%d.tmp' % (os.path.basename(file_path), os.getpid())
+                )
+
+                with open(staging_path, 'w') as staging_file:
+                    staging_file.write(staged_file['contents'])
+
+            # Keep the permissions of files being replaced
+            if os.path.isfile(file_path):
+                shutil.copymode(file_path, staging_path)
+
+            try:
+                os.replace(staging_path, file_path)
+            except OSError:
+                # The staging directory is on another device, so the file can't be renamed
+                shutil.move(staging_path, file_path)
+
+            # Remember where the markers of updated files are, so they aren't scanned again
+            if 'markers' in staged_file:
+                MarkerIndex.record(file_path, staged_file['markers'])
+
+    def discard(self) -> None:
+        """Drops every staged change without touching the project"""
+        for file_path in self.get_paths():
+            self.__unstage(file_path)
+
+        self.__remove_staging_directory()
+
+    def format_plan(self) -> str:
+        """Describes the staged changes, with a diff of every existing file which would be updated"""
+        lines = []
+
+        for file_path in self.__staged_files:
+            if not os.path.isfile(file_path):
+                lines.append('create %s (%d lines)' % (file_path, len(self.read(file_path).splitlines())))
+                continue
+
+            lines.append('update %s' % file_path)
+
+            with open(file_path, 'r') as project_file:
+                current_contents = project_file.read()
+
+            lines += [
+                line.rstrip('\n') for line in difflib.unified_diff(
+                    current_contents.splitlines(True),
+                    self.read(file_path).splitlines(True),
+                    fromfile='a/' + file_path,
+                    tofile='b/' + file_path,
+                )
+            ]
+
+        return '\n'.join(lines)
+
+    def __apply_insertions(self, file_path: str, contents: str, markers: list, insertions: dict) -> tuple:
+        """Inserts code at the marker tags in the contents of a file
+
+        :param markers: the markers in the contents, or None to find them
+        :raises Exception: if a tag isn't in the contents exactly once
+        :return: the updated contents, and the markers found in them
+        """
+        if markers is None:
+            markers = MarkerIndex.scan(contents)
+
+        tags = [marker['tag'] for marker in markers]
+
+        for tag in insertions:
+            # Ensure the tag we are updating is in the destination file
+            if tag not in tags:
+                raise(ProjectFileError('Could not find marker tag "%s" in file %s.' %
+                                       (tag, file_path), file_path))
+
+            # Ensure there is only one occurrence of the tag we are updating
+            if tags.count(tag) > 1:
+                raise(ProjectFileError('Duplicate marker tag %s in file %s.' %
+                                       (tag, file_path), file_path))
+
+        return MarkerIndex.splice(contents, markers, insertions)
+
+    def __unstage(self, file_path: str) -> None:
+        staged_file = self.__staged_files.pop(file_path, None)
+
+        if staged_file is not None and 'staging_path' in staged_file:
+            if os.path.exists(staged_file['staging_path']):
+                os.remove(staged_file['staging_path'])
+
+    def __remove_staging_directory(self) -> None:
+        # Only this generation's directory is removed, as others may be staging files alongside it
+        try:
+            os.rmdir(self.__staging_directory)
+        except OSError:
+            pass
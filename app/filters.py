@@ -0,0 +1,147 @@
+import os
+import json
+import inflection
+from collections import OrderedDict
+from app import config
+from app.profiler import Profiler
+
+
+class TemplateFilters(object):
+
+    # Bump when a change to the template filters or helpers changes rendered output
+    VERSION = 1
+
+    # Maximum number of results kept for each filter
+    CACHE_SIZE = 4096
+
+    # Filters whose results are kept between runs, as they're too slow to recompute
+    PERSISTED_FILTERS = ['plural', 'singular']
+
+    # Results are shared by every instance, so every parser and config index in the process reuses them
+    __caches = {}
+    __stats = {}
+    __is_loaded = False
+    __is_changed = False
+
+    def plural(self, text: str) -> str:
+        return self.__apply('plural', inflection.pluralize, text)
+
+    def singular(self, text: str) -> str:
+        return self.__apply('singular', inflection.singularize, text)
+
+    def camel(self, text: str) -> str:
+        return self.__apply('camel', self.__to_camel, text)
+
+    def kebab(self, text: str) -> str:
+        return self.__apply('kebab', lambda text: text.lower().replace(' ', '-'), text)
+
+    def pascal(self, text: str) -> str:
+        return self.__apply('pascal', lambda text: text.replace(' ', ''), text)
+
+    def snake(self, text: str) -> str:
+        return self.__apply('snake', lambda text: text.lower().replace(' ', '_'), text)
+
+    @classmethod
+    def get_stats(cls) -> list:
+        """Returns the number of cached results and the cache hits and misses of each filter in this process"""
+        return [
+            {'filter': name, 'size': len(cls.__caches.get(name, {})), 'hits': hits, 'misses': misses}
+            for (name, (hits, misses)) in sorted(cls.__stats.items())
+        ]
+
+    @classmethod
+    def save(cls) -> None:
+        """Writes the results of the persisted filters to the cache directory, if any were added"""
+        if not cls.__is_changed or not config.PERSIST_FILTER_CACHE:
+            return
+
+        cache = {
+            'version': cls.__get_cache_version(),
+            'filters': {
+                name: dict(cls.__caches.get(name, {})) for name in cls.PERSISTED_FILTERS
+            },
+        }
+
+        temporary_path = '%s.%d.tmp' % (cls.__get_cache_path(), os.getpid())
+
+        # Other processes may be loading the cache, so it's only ever replaced whole
+        try:
+            os.makedirs(config.CACHE_DIR, exist_ok=True)
+
+            with open(temporary_path, 'w') as cache_file:
+                cache_file.write(json.dumps(cache))
+
+            os.replace(temporary_path, cls.__get_cache_path())
+        except OSError:
+            return
+
+        cls.__is_changed = False
+
+    def __apply(self, name: str, function, text: str) -> str:
+        """Returns the filter's result for the text, computing it only if it isn't cached
+
+        The least recently used result is dropped once the filter has CACHE_SIZE results.
+        """
+        if not self.__is_loaded:
+            self.__load()
+
+        cache = self.__caches.setdefault(name, OrderedDict())
+        (hits, misses) = self.__stats.get(name, (0, 0))
+
+        if text in cache:
+            cache.move_to_end(text)
+            self.__stats[name] = (hits + 1, misses)
+            Profiler.count('filter: %s' % name, hit=True)
+
+            return cache[text]
+
+        self.__stats[name] = (hits, misses + 1)
+        Profiler.count('filter: %s' % name)
+
+        result = function(text)
+
+        cache[text] = result
+
+        if len(cache) > self.CACHE_SIZE:
+            cache.popitem(last=False)
+
+        if name in self.PERSISTED_FILTERS:
+            TemplateFilters.__is_changed = True
+
+        return result
+
+    def __to_camel(self, text: str) -> str:
+        words = text.lower().split(' ')
+
+        return words[0] + ''.join(
+            word.capitalize() for word in words[1:]
+        )
+
+    @classmethod
+    def __load(cls) -> None:
+        cls.__is_loaded = True
+
+        if not config.PERSIST_FILTER_CACHE or not os.path.isfile(cls.__get_cache_path()):
+            return
+
+        try:
+            with open(cls.__get_cache_path(), 'r') as cache_file:
+                cache = json.loads(cache_file.read())
+        except (OSError, ValueError):
+            # An unreadable cache only costs computing the results again
+            return
+
+        # Results from another version of the filters or the inflection rules may differ
+        if cache.get('version') != cls.__get_cache_version():
+            return
+
+        for (name, results) in cache['filters'].items():
+            cls.__caches[name] = OrderedDict(list(results.items())[-cls.CACHE_SIZE:])
+
+    @classmethod
+    def __get_cache_version(cls) -> str:
+        return '%d:%s' % (cls.VERSION, inflection.__version__)
+
+    @classmethod
+    def __get_cache_path(cls) -> str:
+        return os.path.join(config.CACHE_DIR, 'filters.json')
@@ -0,0 +1,76 @@
+import os
+import subprocess
+from app.lock import FileLock
+from app.profiler import Profiler
+
+
+class CodeFormatter(object):
+
+    def __init__(self):
+        self.__file_paths = []
+
+    def add(self, file_path: str) -> None:
+        """Queues the file at the provided path for formatting
+
+        :param file_path: the path of the generated or updated project file
+        """
+        if file_path not in self.__file_paths:
+            self.__file_paths.append(file_path)
+
+    def run(self) -> None:
+        """Formats every queued file, running each tool at most once and only over the queued files
+
+        The files are locked while they're formatted, as the tools rewrite them and would
+        otherwise drop code another generator process inserted in the meantime.
+        """
+        php_paths = self.__filter_paths(['.php'])
+        script_paths = self.__filter_paths(['.js', '.vue'])
+
+        with FileLock(php_paths + script_paths):
+            # Prettier normalises the generated PHP before php-cs-fixer applies the project rules
+            if len(php_paths) > 0:
+                self.__run_tool(
+                    'formatter: prettier',
+                    self.__resolve_executable('node_modules/.bin/prettier', 'prettier'),
+                    ['--write'] + php_paths
+                )
+
+                self.__run_tool(
+                    'lint: php-cs-fixer',
+                    self.__resolve_executable('vendor/bin/php-cs-fixer', 'php-cs-fixer'),
+                    ['fix', '--quiet'] + php_paths
+                )
+
+            if len(script_paths) > 0:
+                self.__run_tool(
+                    'lint: eslint',
+                    self.__resolve_executable('node_modules/.bin/eslint', 'eslint'),
+                    ['--fix'] + script_paths
+                )
+
+        self.__file_paths = []
+
+    def __filter_paths(self, extensions: list) -> list:
+        return [
+            file_path for file_path in self.__file_paths
+            if os.path.splitext(file_path)[1] in extensions
+        ]
+
+    def __resolve_executable(self, local_path: str, name: str) -> str:
+        """Prefers the project's locally installed binary over the one in the system PATH"""
+        if os.path.isfile(local_path):
+            return local_path
+
+        return name
+
+    def __run_tool(self, stage: str, executable: str, arguments: list) -> None:
+        # Formatting is best-effort, so missing tools and lint failures are ignored
+        try:
+            with Profiler.measure(stage):
+                subprocess.run(
+                    [executable] + arguments,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+        except OSError:
+            pass
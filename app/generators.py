@@ -1,7 +1,15 @@
 import os
-import re
 import json
 from app import config
+from app.filesystem import ProjectFileError
+from app.filesystem import VirtualFilesystem
+from app.filters import TemplateFilters
+from app.formatter import CodeFormatter
+from app.manifest import GenerationManifest
+from app.markers import MarkerIndex
+from app.pool import RenderPool
+from app.profiler import Profiler
+from app.projects import ProjectFanout
 from app.template import TemplateParser
 from app.schema import ModuleConfigParser
 from app.schema import PageTemplateConfigParser
@@ -12,57 +20,213 @@ from datetime import datetime
 class Generator(object):
 
     @classmethod
-    def build(cls, config_path: str, args: list):
-        """Builds new and existing project files for the provided json config"""
+    def build(cls, config_path: str, args: list, formatter: CodeFormatter = None, manifest: GenerationManifest = None) -> bool:
+        """Builds new and existing project files for the provided json config
 
+        :param formatter: a formatter shared between several builds, which the caller is responsible for running
+        :param manifest: a manifest shared between several builds, which the caller is responsible for saving
+        :return: if the generation completed successfully
+        """
         print('Parsing JSON config...')
 
         # Ensure the provided config file exists
         if not os.path.exists(config_path):
-            return print('Config file does not exist, please check the provided path and try again')
+            print('Config file does not exist, please check the provided path and try again')
+            return False
 
         # Read the config file and convert to JSON
-        with open(config_path, 'r') as config_file:
+        with open(config_path, 'r') as config_file, Profiler.measure('config parse'):
             try:
                 config_dict = json.loads(config_file.read())
             except:
-                return print('Could not parse provided config as JSON, please check input file and try again')
+                print('Could not parse provided config as JSON, please check input file and try again')
+                return False
+
+        # Generate the config into several projects instead of the current directory
+        if cls.get_option(args, '--projects') is not None:
+            return ProjectFanout.build(cls, config_dict, cls.get_option(args, '--projects'), args)
+
+        return cls.build_config(config_dict, args, formatter, manifest)
+
+    @classmethod
+    def build_config(cls, config_dict: dict, args: list, formatter: CodeFormatter = None, manifest: GenerationManifest = None, errors: list = None) -> bool:
+        """Builds new and existing project files for the provided config
+
+        :param formatter: a formatter shared between several builds, which the caller is responsible for running
+        :param manifest: a manifest shared between several builds, which the caller is responsible for saving
+        :param errors: a list to add the error which stopped the generation to, with its stage, message and the destination it applies to
+        :return: if the generation completed successfully
+        """
+        owns_formatter = formatter is None
+
+        if owns_formatter:
+            formatter = CodeFormatter()
+            manifest = GenerationManifest(config.MANIFEST_PATH)
 
         # Ensure the JSON config is valid
         try:
-            cls._get_config_parser().parse(config_dict)
+            config_dict = cls.parse_config(config_dict)
         except Exception as exception:
-            return print('The following error detected was in was detected in your config file, please fix it and run the generator again:\n\n%s' % str(exception))
+            print('The following error detected was in was detected in your config file, please fix it and run the generator again:\n\n%s' % str(exception))
+            return cls.__add_error(errors, 'config', exception)
 
         parser = TemplateParser(config_dict)
+        filesystem = VirtualFilesystem(config.STAGING_DIR)
 
         print('Generating template files...')
 
-        # Generate new template files
+        # Stage new template files
         if not "--skip-templates" in args:
             try:
-                cls.__generate_templates(parser, args)
+                cls.__generate_templates(parser, args, filesystem, manifest)
             except Exception as exception:
-                return print('The following error occured during template generation, aborting:\n\n%s' % str(exception))
+                filesystem.discard()
+                manifest.discard()
+                print('The following error occured during template generation, aborting:\n\n%s' % str(exception))
+                return cls.__add_error(errors, 'templates', exception)
 
         print('Updating dynamic files...')
 
-        # Update existing dynamic files
+        # Stage updates to existing dynamic files
         if not "--skip-updates" in args:
             try:
-                cls.__update_dynamic_files(parser, args)
+                cls.__update_dynamic_files(parser, args, filesystem, manifest)
             except Exception as exception:
-                return print('The following error occured during updating dynamic files, aborting:\n\n%s' % str(exception))
+                filesystem.discard()
+                manifest.discard()
+                print('The following error occured during updating dynamic files, aborting:\n\n%s' % str(exception))
+                return cls.__add_error(errors, 'update', exception)
+
+        # Show what would be written instead of writing it
+        if "--dry-run" in args:
+            print(filesystem.format_plan() or 'No files would be changed.')
+
+            filesystem.discard()
+            manifest.discard()
+
+            if owns_formatter:
+                Profiler.report(args)
 
-        print('Fixing cs...')
+            print('Dry run completed, no files were changed.')
 
-        # Run php-cs-fixer and eslint
-        if not "--skip-cs-fix" in args:
-            os.system(
-                'composer lint &>/dev/null && yarn lint --fix &>/dev/null')
+            return True
+
+        # Only write to the project once every file was generated without errors
+        try:
+            with Profiler.measure('file write'):
+                for file_path in filesystem.commit():
+                    formatter.add(file_path)
+        except Exception as exception:
+            filesystem.discard()
+            manifest.discard()
+            print('The following error occured while writing the project files, aborting:\n\n%s' % str(exception))
+            return cls.__add_error(errors, 'write', exception)
+
+        manifest.commit()
+
+        # Run prettier, php-cs-fixer and eslint over the touched files
+        if owns_formatter:
+            print('Fixing cs...')
+
+            if not "--skip-cs-fix" in args:
+                formatter.run()
+
+            manifest.save()
+            MarkerIndex.save()
+            TemplateFilters.save()
+
+            Profiler.report(args)
 
         print('Generation completed successfully.')
 
+        return True
+
+    @classmethod
+    def __add_error(cls, errors: list, stage: str, exception: Exception) -> bool:
+        """Adds the error which stopped a generation to the caller's list, if it gave one
+
+        :return: False, as the generation failed
+        """
+        if errors is not None:
+            error = {'stage': stage, 'message': str(exception)}
+
+            if isinstance(exception, ProjectFileError):
+                error['destination'] = exception.file_path
+
+            errors.append(error)
+
+        return False
+
+    @classmethod
+    def parse_config(cls, config_dict: dict) -> dict:
+        """Validates the provided config and applies its default settings
+
+        :raises Exception: if the config is invalid
+        :return: the parsed config
+        """
+        return cls._get_config_parser().parse(config_dict)
+
+    @classmethod
+    def preview(cls, config_dict: dict) -> list:
+        """Renders the template and dynamic files for a parsed config without touching the project
+
+        :return: a list of the rendered files, each with its destination, template and contents, plus the marker tag of dynamic files
+        """
+        parser = TemplateParser(config_dict)
+        rendered_files = cls.get_outputs(parser)
+
+        for rendered_file in rendered_files:
+            rendered_file['contents'] = parser.render_file(rendered_file['template'])
+
+        return rendered_files
+
+    @classmethod
+    def get_outputs(cls, parser: TemplateParser) -> list:
+        """Lists the files the generator renders for a config, without rendering them
+
+        :param parser: the template parser of the parsed config
+        :return: a list of the template and dynamic files, each with its destination and template, plus the marker tag of dynamic files
+        """
+        outputs = []
+
+        for (source_path, destination_path) in cls._get_template_files():
+            outputs.append({
+                'destination': parser.render_string(destination_path),
+                'template': '%s/%s' % (cls._get_template_subdirectory(), source_path),
+            })
+
+        for (source_path, tag, destination_path) in cls._get_dynamic_files():
+            outputs.append({
+                'destination': parser.render_string(destination_path),
+                'template': '%s/%s' % (cls._get_template_subdirectory(), source_path),
+                'tag': tag,
+            })
+
+        return outputs
+
+    @classmethod
+    def get_template_names(cls) -> list:
+        """Returns the names of every template the generator renders, both new files and dynamic files"""
+        return [
+            '%s/%s' % (cls._get_template_subdirectory(), source_path)
+            for (source_path, *destination) in cls._get_template_files() + cls._get_dynamic_files()
+        ]
+
+    @classmethod
+    def get_option(cls, args: list, name: str, default: str = None) -> str:
+        """Returns the value of a command line option given in the form --name=value
+
+        :param args: the command line arguments
+        :param name: the name of the option, including the leading dashes
+        :param default: the value to use if the option wasn't given
+        :return: the value of the option
+        """
+        for arg in args:
+            if arg.startswith(name + '='):
+                return arg[len(name) + 1:]
+
+        return default
+
     @classmethod
     def _get_dynamic_files(cls) -> list:
         """Returns a list of dynamic files which are updated when the generator is run
@@ -88,101 +252,203 @@ class Generator(object):
         return None
 
     @classmethod
-    def __generate_templates(cls, parser: TemplateParser, args: list):
-        """Generate new project files defined by _get_template_files
+    def __generate_templates(cls, parser: TemplateParser, args: list, filesystem: VirtualFilesystem, manifest: GenerationManifest):
+        """Stage new project files defined by _get_template_files
+
+        Files recorded in the manifest are skipped when neither their template nor the parts of
+        the config it reads have changed, and are rewritten without --overwrite if they haven't been edited since.
 
         :return: if the operation completed successfully
         """
+        pending_outputs = []
+
         for (source_path, destination_path) in cls._get_template_files():
+            template_name = '%s/%s' % (cls._get_template_subdirectory(), source_path)
+            template_hash = TemplateParser.get_template_hash(template_name)
+            input_hash = parser.get_input_hash(template_name)
+
+            output_key = cls.__get_output_key(parser, template_name)
+            entry = manifest.get(output_key)
+
             destination_path = parser.render_string(destination_path)
-            destination_directory = os.path.dirname(destination_path)
 
-            # Create the destination folder if it doesn't exist already
-            if not os.path.exists(destination_directory):
-                os.makedirs(destination_directory)
+            # Keep writing to the previously generated file, e.g. a timestamped migration
+            if entry is not None and os.path.isfile(entry['destination']):
+                destination_path = entry['destination']
 
-            # Abort if the destination file already exists to prevent overwriting
-            if os.path.isfile(destination_path) and not "--overwrite" in args:
-                raise(Exception('%s already exists.\nUse --overwrite to ignore this warning.' %
-                                destination_path))
-
-            # Render and write the template to the destination file
-            with open(destination_path, 'w') as destination_file:
-                rendered_template = parser.render_file(
-                    '%s/%s/%s' % (config.TEMPLATE_DIR,
-                                  cls._get_template_subdirectory(), source_path)
-                )
+            is_unmodified = manifest.is_unmodified(output_key)
 
-                destination_file.write(rendered_template)
+            # Skip outputs which were generated from the same inputs and left untouched
+            if (
+                is_unmodified and
+                entry['template'] == template_hash and
+                entry['config'] == input_hash and
+                not "--force" in args
+            ):
+                continue
 
-            # Run prettier if destination file is PHP
-            if not "--skip-cs-fixer" in args and destination_path.endswith('.php'):
-                os.system('prettier %s --write &>/dev/null' % destination_path)
+            # Abort if the destination file already exists to prevent overwriting
+            if (
+                os.path.isfile(destination_path) and
+                not is_unmodified and
+                not "--overwrite" in args
+            ):
+                raise(ProjectFileError('%s already exists.\nUse --overwrite to ignore this warning.' %
+                                       destination_path, destination_path))
+
+            pending_outputs.append([
+                template_name,
+                destination_path,
+                output_key,
+                {
+                    'destination': destination_path,
+                    'template': template_hash,
+                    'config': input_hash,
+                    'output': None,
+                }
+            ])
+
+        # Render in memory for a dry run, otherwise stream each template into the staging directory
+        for pending_output in pending_outputs:
+            pending_output.append(
+                None if "--dry-run" in args else filesystem.get_staging_path(pending_output[1])
+            )
+
+        staged_paths = []
+
+        try:
+            # Render concurrently, staging each file as soon as it and those before it are ready
+            rendered_outputs = RenderPool.render(
+                parser.get_config(),
+                [[template_name, staging_path] for (template_name, *_, staging_path) in pending_outputs],
+                RenderPool.parse_jobs(cls.get_option(args, '--jobs', '1')),
+                cls.get_option(args, '--pool', 'process')
+            )
+
+            for (pending_output, rendered_output) in zip(pending_outputs, rendered_outputs):
+                (template_name, destination_path, output_key, entry, staging_path) = pending_output
+
+                manifest.record(output_key, entry)
+
+                rendered_hash = rendered_output
+
+                if staging_path is None:
+                    rendered_hash = GenerationManifest.hash_text(rendered_output)
+
+                # Leave the file alone if its contents wouldn't change
+                if GenerationManifest.hash_file(destination_path) == rendered_hash:
+                    continue
+
+                if staging_path is None:
+                    filesystem.write(destination_path, rendered_output)
+                else:
+                    filesystem.stage(destination_path, staging_path)
+                    staged_paths.append(staging_path)
+        finally:
+            # Remove the rendered contents of unchanged files, and of every file rendering didn't reach
+            for (*_, staging_path) in pending_outputs:
+                if staging_path is not None and staging_path not in staged_paths:
+                    if os.path.exists(staging_path):
+                        os.remove(staging_path)
 
         return True
 
     @ classmethod
-    def __update_dynamic_files(cls, parser: TemplateParser, args: list):
-        """Updates existing project files defined by _get_dynamic_files
+    def __update_dynamic_files(cls, parser: TemplateParser, args: list, filesystem: VirtualFilesystem, manifest: GenerationManifest):
+        """Stages updates to existing project files defined by _get_dynamic_files
+
+        Insertions recorded in the manifest aren't repeated, as that would duplicate the inserted code.
+        The insertions are queued rather than applied, so they're made to the files as they are when
+        written, and other generator processes updating the same files don't lose each other's code.
 
         :return: if the operation completed successfully
         """
-        for (source_path, tag, destination_path) in cls._get_dynamic_files():
-            destination_path = parser.render_string(destination_path)
+        for (destination_path, updates) in cls.__group_dynamic_files(parser, args, manifest):
             destination_directory = os.path.dirname(destination_path)
 
             # Ensure the destination folder exists
-            if not os.path.exists(destination_directory):
-                raise(Exception('Couldn\'t find the directory "%s" to update append.' %
-                                destination_directory))
+            if not filesystem.isdir(destination_directory):
+                raise(ProjectFileError('Couldn\'t find the directory "%s" to update append.' %
+                                       destination_directory, destination_path))
 
             # Ensure the destination file exists
-            if not os.path.isfile(destination_path):
-                raise(Exception('Couldn\'t find the file "%s" to update, aborting.' %
-                                destination_path))
+            if not filesystem.isfile(destination_path):
+                raise(ProjectFileError('Couldn\'t find the file "%s" to update, aborting.' %
+                                       destination_path, destination_path))
 
-            # Read the current contents of the destination file and locate tags
-            with open(destination_path, 'r') as destination_file:
-                destination_contents = destination_file.read()
+            insertions = {}
 
-                code_tags = re.findall(
-                    r'\/\*--OPTIMUS-CLI:([\w-]*)--\*\/', destination_contents)
+            for (source_path, tag, output_key, entry) in updates:
+                # Render the dynamic content to place at the tag
+                insertions[tag] = parser.render_file(
+                    '%s/%s' % (cls._get_template_subdirectory(), source_path)
+                )
 
-                view_tags = re.findall(
-                    r'<\!--OPTIMUS-CLI:([\w-]*)-->', destination_contents)
+                entry['rendered'] = GenerationManifest.hash_text(insertions[tag])
 
-                destination_tags = code_tags + view_tags
+            # Queue every update to the destination file at once, checking its marker tags
+            with Profiler.measure('dynamic file read'):
+                filesystem.insert(destination_path, insertions)
 
-            # Ensure the tag we are updating is in the destination file
-            if tag not in destination_tags:
-                raise(Exception('Could not find marker tag "%s" in file %s.' %
-                                (tag, destination_path)))
+            for (source_path, tag, output_key, entry) in updates:
+                manifest.record(output_key, entry)
 
-            # Ensure there is only one occurrence of the tag we are updating
-            if destination_tags.count(tag) > 1:
-                raise(Exception('Duplicate marker tag %s in file %s.' %
-                                (tag, destination_path)))
+        return True
 
-            # Render and write the dynamic content and place it in the destination file
-            with open(destination_path, 'w') as destination_file:
-                rendered_content = parser.render_file(
-                    '%s/%s/%s' % (config.TEMPLATE_DIR,
-                                  cls._get_template_subdirectory(), source_path)
-                )
+    @classmethod
+    def __group_dynamic_files(cls, parser: TemplateParser, args: list, manifest: GenerationManifest) -> list:
+        """Groups the pending dynamic files by destination so each file is only read and written once
 
-                updated_contents = destination_contents.replace(
-                    '/*--OPTIMUS-CLI:%s--*/' % tag, rendered_content
-                )
+        :return: a nested array containing each destination path and its source paths, tags and manifest entries, in definition order
+        """
+        grouped_updates = {}
+
+        for (source_path, tag, destination_path) in cls._get_dynamic_files():
+            template_name = '%s/%s' % (cls._get_template_subdirectory(), source_path)
+            template_hash = TemplateParser.get_template_hash(template_name)
+            input_hash = parser.get_input_hash(template_name)
+
+            destination_path = parser.render_string(destination_path)
 
-                updated_contents = updated_contents.replace(
-                    '<!--OPTIMUS-CLI:%s-->' % tag, rendered_content
+            output_key = '%s:%s' % (cls.__get_output_key(parser, template_name), tag)
+            entry = manifest.get(output_key)
+
+            if entry is not None and not "--force" in args:
+                if entry['template'] == template_hash and entry['config'] == input_hash:
+                    continue
+
+                rendered_hash = GenerationManifest.hash_text(
+                    parser.render_file(template_name)
                 )
 
-                destination_file.write(updated_contents)
+                # The inputs changed without affecting the inserted code
+                if rendered_hash == entry['rendered']:
+                    entry['template'] = template_hash
+                    entry['config'] = input_hash
+                    manifest.record(output_key, entry)
+                else:
+                    print('The "%s" code in %s was generated from an older config or template, please update it by hand.' %
+                          (tag, destination_path))
+
+                continue
+
+            grouped_updates.setdefault(destination_path, []).append([
+                source_path,
+                tag,
+                output_key,
+                {
+                    'destination': destination_path,
+                    'template': template_hash,
+                    'config': input_hash,
+                }
+            ])
+
+        return list(grouped_updates.items())
 
-            # Run prettier if destination file is PHP
-            if not "--skip-cs-fixer" in args and destination_path.endswith('.php'):
-                os.system('prettier %s --write &>/dev/null' % destination_path)
+    @classmethod
+    def __get_output_key(cls, parser: TemplateParser, template_name: str) -> str:
+        """Identifies an output in the manifest by its template and the config's name"""
+        return '%s:%s' % (template_name, parser.get_config()['name'])
 
 
 class ModuleGenerator(Generator):
@@ -200,43 +466,43 @@ class ModuleGenerator(Generator):
         return [
             [
                 'back/Controller.php.j2',
-                'app/Http/Controllers/Back/Api/{{ name | plural | pascal }}Controller.php'
+                'app/Http/Controllers/Back/Api/{{ index.names.plural_pascal }}Controller.php'
             ],
             [
                 'back/Model.php.j2',
-                'app/Models/{{ name | singular | pascal }}.php'
+                'app/Models/{{ index.names.singular_pascal }}.php'
             ],
             [
                 'back/Resource.php.j2',
-                'app/Http/Resources/{{ name | singular | pascal }}Resource.php'
+                'app/Http/Resources/{{ index.names.singular_pascal }}Resource.php'
             ],
             [
                 'back/Migration.php.j2',
-                'database/migrations/%s_create_{{ name | plural | snake }}_table.php' % cls.__get_datetime()
+                'database/migrations/%s_create_{{ index.names.plural_snake }}_table.php' % cls.__get_datetime()
             ],
             [
                 'front/api.js.j2',
-                'resources/js/back/modules/{{ name | plural | kebab }}/routes/api.js'
+                'resources/js/back/modules/{{ index.names.plural_kebab }}/routes/api.js'
             ],
             [
                 'front/app.js.j2',
-                'resources/js/back/modules/{{ name | plural | kebab }}/routes/app.js'
+                'resources/js/back/modules/{{ index.names.plural_kebab }}/routes/app.js'
             ],
             [
                 'front/Create.vue.j2',
-                'resources/js/back/modules/{{ name | plural | kebab }}/views/Create.vue'
+                'resources/js/back/modules/{{ index.names.plural_kebab }}/views/Create.vue'
             ],
             [
                 'front/Edit.vue.j2',
-                'resources/js/back/modules/{{ name | plural | kebab }}/views/Edit.vue'
+                'resources/js/back/modules/{{ index.names.plural_kebab }}/views/Edit.vue'
             ],
             [
                 'front/Index.vue.j2',
-                'resources/js/back/modules/{{ name | plural | kebab }}/views/Index.vue'
+                'resources/js/back/modules/{{ index.names.plural_kebab }}/views/Index.vue'
             ],
             [
                 'front/Form.vue.j2',
-                'resources/js/back/modules/{{ name | plural | kebab }}/views/partials/Form.vue'
+                'resources/js/back/modules/{{ index.names.plural_kebab }}/views/partials/Form.vue'
             ]
         ]
 
@@ -300,11 +566,11 @@ class PageGenerator(Generator):
         return [
             [
                 'back/Template.php.j2',
-                'app/PageTemplates/{{ name | pascal }}Template.php'
+                'app/PageTemplates/{{ index.names.name_pascal }}Template.php'
             ],
             [
                 'front/Form.vue.j2',
-                'resources/js/back/modules/pages/views/templates/{{ name | pascal }}.vue'
+                'resources/js/back/modules/pages/views/templates/{{ index.names.name_pascal }}.vue'
             ]
         ]
 
@@ -327,3 +593,10 @@ class PageGenerator(Generator):
                 'app/Providers/OptimusServiceProvider.php'
             ]
         ]
+
+
+# Generators available to commands which are given the kind of config to generate
+GENERATORS = {
+    'module': ModuleGenerator,
+    'page': PageGenerator,
+}
@@ -0,0 +1,92 @@
+from app.filters import TemplateFilters
+
+
+class FrozenDict(dict):
+    """A dict which can't be changed once created, so a parsed config can be shared between workers and builds"""
+
+    def __read_only(self, *args, **kwargs):
+        raise(TypeError('Parsed configs are read only'))
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = __read_only
+
+    def __reduce__(self):
+        # Unpickling a dict subclass sets its items one by one, which isn't allowed
+        return (self.__class__, (dict(self),))
+
+
+class IndexedConfig(FrozenDict):
+
+    def __init__(self, config_dict: dict, index: dict):
+        super().__init__(config_dict)
+        self.index = index
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self), self.index))
+
+
+class ConfigIndex(object):
+
+    __filters = TemplateFilters()
+
+    @classmethod
+    def get(cls, config_dict: dict) -> dict:
+        """Returns the index of a parsed config, building it if the config wasn't indexed when parsed"""
+        if isinstance(config_dict, IndexedConfig):
+            return config_dict.index
+
+        return cls.build(config_dict)
+
+    @classmethod
+    def build(cls, config_dict: dict) -> dict:
+        """Indexes a parsed config so templates can look up its contents without scanning them
+
+        :return: the features and fields keyed by type, the fields shown on the admin index,
+            the media groups and conversions of every media feature (or the page template's
+            conversions), and the module name in each case used by the templates, e.g.
+            names.plural_pascal
+        """
+        features = {}
+        fields = {}
+        admin_index_fields = []
+        media_groups = []
+        conversions = list(config_dict.get('conversions', []))
+
+        for feature in config_dict.get('features', []):
+            features.setdefault(feature['type'], []).append(feature)
+
+            if feature['type'] == 'media':
+                media_groups += feature['options'].get('media_groups', [])
+                conversions += feature['options'].get('conversions', [])
+
+        for field in config_dict.get('fields', []):
+            fields.setdefault(field['type'], []).append(field)
+
+            if field.get('show_on_admin_index'):
+                admin_index_fields.append(field)
+
+        return {
+            'features': features,
+            'fields': fields,
+            'admin_index_fields': admin_index_fields,
+            'media_groups': media_groups,
+            'conversions': conversions,
+            'names': cls.__build_names(config_dict['name']),
+        }
+
+    @classmethod
+    def __build_names(cls, name: str) -> dict:
+        names = {}
+
+        for (base, base_name) in [
+            ('name', name),
+            ('singular', cls.__filters.singular(name)),
+            ('plural', cls.__filters.plural(name)),
+        ]:
+            names[base] = base_name
+            names[base + '_lower'] = base_name.lower()
+            names[base + '_camel'] = cls.__filters.camel(base_name)
+            names[base + '_kebab'] = cls.__filters.kebab(base_name)
+            names[base + '_snake'] = cls.__filters.snake(base_name)
+            names[base + '_pascal'] = cls.__filters.pascal(base_name)
+
+        return names
@@ -0,0 +1,65 @@
+import os
+import hashlib
+from app import config
+from app.profiler import Profiler
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no advisory locks, so generations there mustn't run concurrently
+    fcntl = None
+
+
+class FileLock(object):
+    """Advisory locks on project files, stopping generator processes running at the same time from losing each other's updates
+
+    Files are replaced by renaming their new contents into place, so each file is locked
+    through a lock file in the lock directory rather than through the file itself.
+    Locks are only advisory: they don't stop other programs from changing the files.
+    """
+
+    def __init__(self, file_paths: list):
+        # Locking in a consistent order stops two processes each waiting for a file the other holds
+        self.__file_paths = sorted(set(os.path.abspath(file_path) for file_path in file_paths))
+        self.__lock_files = []
+
+    def __enter__(self):
+        if fcntl is None or len(self.__file_paths) == 0:
+            return self
+
+        if not os.path.exists(config.LOCK_DIR):
+            os.makedirs(config.LOCK_DIR, exist_ok=True)
+
+        with Profiler.measure('lock wait'):
+            try:
+                for file_path in self.__file_paths:
+                    lock_file = open(self.get_lock_path(file_path), 'a')
+                    self.__lock_files.append(lock_file)
+
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                self.__release()
+                raise
+
+        return self
+
+    def __exit__(self, exception_type, exception, traceback) -> None:
+        self.__release()
+
+    @classmethod
+    def get_lock_path(cls, file_path: str) -> str:
+        """Returns the path of the lock file for a project file
+
+        Lock files are left in place, as removing one could let two processes lock the same file through different lock files.
+        """
+        return os.path.join(
+            config.LOCK_DIR,
+            '%s.lock' % hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+        )
+
+    def __release(self) -> None:
+        # Closing the lock files releases their locks
+        for lock_file in self.__lock_files:
+            lock_file.close()
+
+        self.__lock_files = []
@@ -0,0 +1,114 @@
+import os
+import json
+import hashlib
+from app.lock import FileLock
+
+
+class GenerationManifest(object):
+
+    def __init__(self, file_path: str):
+        self.__file_path = file_path
+        self.__entries = self.__load()
+        self.__staged_entries = {}
+        self.__pending_keys = []
+
+    def get(self, key: str) -> dict:
+        """Returns the recorded entry for the provided output key, if there is one"""
+        return self.__entries.get(key)
+
+    def record(self, key: str, entry: dict) -> None:
+        """Records the inputs used to generate an output, once the generated files are committed
+
+        Entries with an "output" key have the hash of their destination file taken when
+        the manifest is saved, so that it reflects the file after formatting.
+
+        :param key: the output key, identifying the template and config it was generated from
+        :param entry: the destination path and input hashes of the output
+        """
+        self.__staged_entries[key] = entry
+
+    def commit(self) -> None:
+        """Keeps the entries recorded since the last commit, after their files were written"""
+        for (key, entry) in self.__staged_entries.items():
+            self.__entries[key] = entry
+
+            if key not in self.__pending_keys:
+                self.__pending_keys.append(key)
+
+        self.__staged_entries = {}
+
+    def discard(self) -> None:
+        """Drops the entries recorded since the last commit, as their files were never written"""
+        self.__staged_entries = {}
+
+    def save(self) -> None:
+        """Hashes the outputs recorded in this run and writes the manifest to disk
+
+        The entries are merged into the manifest as it is on disk, so entries saved by other
+        generator processes since this one loaded the manifest aren't lost.
+        """
+        for key in self.__pending_keys:
+            entry = self.__entries[key]
+
+            if 'output' in entry:
+                entry['output'] = self.hash_file(entry['destination'])
+
+        manifest_directory = os.path.dirname(self.__file_path)
+
+        if manifest_directory:
+            os.makedirs(manifest_directory, exist_ok=True)
+
+        with FileLock([self.__file_path]):
+            entries = self.__load()
+
+            for key in self.__pending_keys:
+                entries[key] = self.__entries[key]
+
+            self.__entries = entries
+            self.__pending_keys = []
+
+            temporary_path = '%s.%d.tmp' % (self.__file_path, os.getpid())
+
+            # Replace the manifest whole, so other processes never read it half written
+            with open(temporary_path, 'w') as manifest_file:
+                manifest_file.write(json.dumps(self.__entries, indent=2, sort_keys=True))
+
+            os.replace(temporary_path, self.__file_path)
+
+    def is_unmodified(self, key: str) -> bool:
+        """Determines if the output recorded for the key is still on disk exactly as it was generated"""
+        entry = self.get(key)
+
+        if entry is None or 'output' not in entry:
+            return False
+
+        return self.hash_file(entry['destination']) == entry['output']
+
+    @classmethod
+    def hash_file(cls, file_path: str) -> str:
+        if not os.path.isfile(file_path):
+            return None
+
+        file_hash = hashlib.sha1()
+
+        # Hash large files in chunks rather than reading them into memory at once
+        with open(file_path, 'rb') as hashed_file:
+            for chunk in iter(lambda: hashed_file.read(65536), b''):
+                file_hash.update(chunk)
+
+        return file_hash.hexdigest()
+
+    @classmethod
+    def hash_text(cls, text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def __load(self) -> dict:
+        if not os.path.isfile(self.__file_path):
+            return {}
+
+        with open(self.__file_path, 'r') as manifest_file:
+            try:
+                return json.loads(manifest_file.read())
+            except ValueError:
+                # A corrupt manifest only costs a full regeneration
+                return {}
@@ -0,0 +1,274 @@
+import os
+import re
+import json
+from app import config
+from app.lock import FileLock
+
+
+class MarkerIndex(object):
+
+    # Matches both the code and view marker tags, capturing the tag name in either group
+    PATTERN = re.compile(r'\/\*--OPTIMUS-CLI:([\w-]*)--\*\/|<\!--OPTIMUS-CLI:([\w-]*)-->')
+
+    # Extensions of the project files which can contain marker tags
+    EXTENSIONS = ('.php', '.js', '.ts', '.vue', '.html')
+
+    # Directories which never contain marker tags, skipped when scanning a project
+    IGNORED_DIRECTORIES = ['.git', '.optimus-cli', 'node_modules', 'vendor', 'storage']
+
+    __entries = {}
+    __loaded_paths = []
+
+    @classmethod
+    def get_markers(cls, file_path: str, contents: str = None) -> list:
+        """Returns the marker tags in a project file, scanning it only if it changed since it was last scanned
+
+        :param file_path: the project file
+        :param contents: the contents of the file, if they were already read. Markers found in
+                         them aren't indexed, as the file may have changed since they were read
+        :return: a list of the markers in the file, each with its tag, line and start and end offsets
+        """
+        cls.__load()
+
+        absolute_path = os.path.abspath(file_path)
+        entry = cls.__entries.get(absolute_path)
+
+        if contents is not None:
+            if entry is not None and cls.is_current(contents, entry['markers']):
+                return entry['markers']
+
+            return cls.scan(contents)
+
+        with open(absolute_path, 'r') as project_file:
+            # Stat the file that's read, so the markers are indexed under the contents they were found in
+            file_stat = os.fstat(project_file.fileno())
+
+            if entry is not None and entry['mtime'] == file_stat.st_mtime_ns and entry['size'] == file_stat.st_size:
+                return entry['markers']
+
+            markers = cls.scan(project_file.read())
+
+        cls.__entries[absolute_path] = {
+            'mtime': file_stat.st_mtime_ns,
+            'size': file_stat.st_size,
+            'markers': markers,
+        }
+
+        return markers
+
+    @classmethod
+    def record(cls, file_path: str, markers: list) -> None:
+        """Records the markers of a project file which was just written, so it doesn't need scanning again"""
+        cls.__load()
+
+        absolute_path = os.path.abspath(file_path)
+        file_stat = os.stat(absolute_path)
+
+        cls.__entries[absolute_path] = {
+            'mtime': file_stat.st_mtime_ns,
+            'size': file_stat.st_size,
+            'markers': markers,
+        }
+
+    @classmethod
+    def scan(cls, contents: str) -> list:
+        """Finds every marker tag in the contents in a single pass
+
+        :return: a list of the markers, each with its tag, line and start and end offsets
+        """
+        markers = []
+
+        # Most files have no markers at all, which is cheaper to rule out than to match
+        if 'OPTIMUS-CLI:' not in contents:
+            return markers
+
+        line = 1
+        line_offset = 0
+
+        for match in cls.PATTERN.finditer(contents):
+            line += contents.count('\n', line_offset, match.start())
+            line_offset = match.start()
+
+            markers.append({
+                'tag': match.group(1) if match.group(1) is not None else match.group(2),
+                'line': line,
+                'start': match.start(),
+                'end': match.end(),
+            })
+
+        return markers
+
+    @classmethod
+    def is_current(cls, contents: str, markers: list) -> bool:
+        """Checks that the markers are exactly the marker tags in the contents, at their offsets
+
+        This is far cheaper than scanning the contents again, so markers from the index are
+        checked before they're used to change a file.
+        """
+        if contents.count('OPTIMUS-CLI:') != len(markers):
+            return False
+
+        for marker in markers:
+            match = cls.PATTERN.fullmatch(contents, marker['start'], marker['end'])
+
+            if match is None or (match.group(1) if match.group(1) is not None else match.group(2)) != marker['tag']:
+                return False
+
+        return True
+
+    @classmethod
+    def splice(cls, contents: str, markers: list, insertions: dict) -> tuple:
+        """Replaces marker tags with the code to insert at them, using their known offsets
+
+        :param contents: the contents of the file
+        :param markers: the markers found in the contents
+        :param insertions: the code to insert, by tag
+        :return: the updated contents, and the markers found in them
+        """
+        # Markers from the index may be for other contents, e.g. after an edit within the mtime resolution
+        if not cls.is_current(contents, markers):
+            markers = cls.scan(contents)
+
+        pieces = []
+        updated_markers = []
+        offset = 0
+        offset_change = 0
+        line_change = 0
+
+        for marker in markers:
+            if marker['tag'] not in insertions:
+                updated_markers.append({
+                    'tag': marker['tag'],
+                    'line': marker['line'] + line_change,
+                    'start': marker['start'] + offset_change,
+                    'end': marker['end'] + offset_change,
+                })
+
+                continue
+
+            inserted_contents = insertions[marker['tag']]
+            inserted_at = marker['start'] + offset_change
+
+            pieces.append(contents[offset:marker['start']])
+            pieces.append(inserted_contents)
+            offset = marker['end']
+
+            # Inserted code usually carries the marker again, ready for the next insertion
+            for inserted_marker in cls.scan(inserted_contents):
+                updated_markers.append({
+                    'tag': inserted_marker['tag'],
+                    'line': inserted_marker['line'] + marker['line'] - 1 + line_change,
+                    'start': inserted_marker['start'] + inserted_at,
+                    'end': inserted_marker['end'] + inserted_at,
+                })
+
+            offset_change += len(inserted_contents) - (marker['end'] - marker['start'])
+            line_change += inserted_contents.count('\n')
+
+        pieces.append(contents[offset:])
+
+        return (''.join(pieces), updated_markers)
+
+    @classmethod
+    def find_markers(cls, directory: str) -> list:
+        """Finds the marker tags in every project file below a directory
+
+        :return: a nested array containing the path and markers of each file with at least one marker
+        """
+        found_markers = []
+
+        for (current_directory, directories, file_names) in os.walk(directory):
+            directories[:] = sorted(
+                name for name in directories if name not in cls.IGNORED_DIRECTORIES
+            )
+
+            for file_name in sorted(file_names):
+                if not file_name.endswith(cls.EXTENSIONS):
+                    continue
+
+                file_path = os.path.relpath(os.path.join(current_directory, file_name))
+
+                try:
+                    markers = cls.get_markers(file_path)
+                except (OSError, UnicodeDecodeError):
+                    continue
+
+                if len(markers) > 0:
+                    found_markers.append([file_path, markers])
+
+        return found_markers
+
+    @classmethod
+    def list_markers(cls, directory: str = '.') -> None:
+        """Prints every injection point in a project, as the markers command"""
+        found_markers = cls.find_markers(directory)
+
+        for (file_path, markers) in found_markers:
+            for marker in markers:
+                print('%s:%d %s' % (file_path, marker['line'], marker['tag']))
+
+        if len(found_markers) == 0:
+            print('No marker tags found in %s.' % directory)
+
+        cls.save()
+
+    @classmethod
+    def save(cls) -> None:
+        """Writes the scanned markers of the files in the current project to disk
+
+        The markers are merged into the index as it is on disk, under a lock, so files
+        scanned by other generator processes since this one loaded the index aren't lost.
+        """
+        cls.__load()
+
+        project_directory = os.path.abspath('.')
+        entries = {}
+
+        for (absolute_path, entry) in cls.__entries.items():
+            if absolute_path.startswith(project_directory + os.sep):
+                entries[os.path.relpath(absolute_path, project_directory)] = entry
+
+        index_directory = os.path.dirname(config.MARKER_INDEX_PATH)
+
+        if index_directory:
+            os.makedirs(index_directory, exist_ok=True)
+
+        with FileLock([config.MARKER_INDEX_PATH]):
+            saved_entries = cls.__read_index()
+
+            # Keep the files other generator processes scanned since this one loaded the index
+            saved_entries.update(entries)
+
+            temporary_path = '%s.%d.tmp' % (config.MARKER_INDEX_PATH, os.getpid())
+
+            # Replace the index whole, so other processes never read it half written
+            with open(temporary_path, 'w') as index_file:
+                index_file.write(json.dumps(saved_entries, sort_keys=True))
+
+            os.replace(temporary_path, config.MARKER_INDEX_PATH)
+
+    @classmethod
+    def __load(cls) -> None:
+        """Loads the markers scanned by previous runs in the current project, once per project"""
+        project_directory = os.path.abspath('.')
+
+        if project_directory in cls.__loaded_paths:
+            return
+
+        cls.__loaded_paths.append(project_directory)
+
+        for (file_path, entry) in cls.__read_index().items():
+            cls.__entries.setdefault(os.path.join(project_directory, file_path), entry)
+
+    @classmethod
+    def __read_index(cls) -> dict:
+        """Reads the marker index of the current project, keyed by paths relative to the project"""
+        if not os.path.isfile(config.MARKER_INDEX_PATH):
+            return {}
+
+        with open(config.MARKER_INDEX_PATH, 'r') as index_file:
+            try:
+                return json.loads(index_file.read())
+            except ValueError:
+                # A corrupt index only costs scanning the files again
+                return {}
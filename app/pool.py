@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from app.profiler import Profiler
+from app.template import TemplateParser
+
+
+class RenderPool(object):
+
+    __executors = {}
+
+    @classmethod
+    def render(cls, config_dict: dict, outputs: list, jobs: int = 1, pool_type: str = 'process'):
+        """Streams the named templates to their output files, concurrently when more than one job is requested
+
+        Results are yielded in the same order as the outputs, so output and error reporting
+        are deterministic; the first failing template in that order raises.
+
+        :param config_dict: the config to render the templates with
+        :param outputs: a nested array containing the template name and absolute output path of each template,
+                        or None as the path to render the template in memory
+        :param jobs: the maximum number of templates to render at once
+        :param pool_type: either "process" or "thread"
+        :return: an iterator over the hashes of the templates rendered to files and the contents of the others
+        """
+        if jobs == 1 or len(outputs) < 2:
+            parser = TemplateParser(config_dict)
+
+            return (
+                _render_with(parser, template_name, output_path)
+                for (template_name, output_path) in outputs
+            )
+
+        executor = cls.__get_executor(pool_type, jobs)
+
+        rendered_hashes = executor.map(
+            _render_template,
+            [config_dict] * len(outputs),
+            [template_name for (template_name, output_path) in outputs],
+            [output_path for (template_name, output_path) in outputs]
+        )
+
+        return cls.__measure_waits(rendered_hashes)
+
+    @classmethod
+    def parse_jobs(cls, value: str) -> int:
+        """Parses the value of the --jobs option, where "auto" uses every available core"""
+        if value == 'auto':
+            return os.cpu_count() or 1
+
+        if not value.isdigit() or int(value) < 1:
+            raise(Exception('The --jobs option must be a positive number or "auto", got "%s".' % value))
+
+        return int(value)
+
+    @classmethod
+    def __measure_waits(cls, rendered_hashes):
+        """Workers can't report their own timings, so measure how long each result is waited on"""
+        while True:
+            with Profiler.measure('render: worker pool wait'):
+                rendered_hash = next(rendered_hashes, None)
+
+            if rendered_hash is None:
+                return
+
+            yield rendered_hash
+
+    @classmethod
+    def __get_executor(cls, pool_type: str, jobs: int):
+        """Returns a pool of workers, reused for every build in this process"""
+        if pool_type not in ['process', 'thread']:
+            raise(Exception('The --pool option must be either "process" or "thread", got "%s".' % pool_type))
+
+        if (pool_type, jobs) not in cls.__executors:
+            executor_class = ProcessPoolExecutor if pool_type == 'process' else ThreadPoolExecutor
+
+            cls.__executors[(pool_type, jobs)] = executor_class(max_workers=jobs)
+
+        return cls.__executors[(pool_type, jobs)]
+
+
+def _render_template(config_dict: dict, template_name: str, output_path: str) -> str:
+    # Workers keep their own shared template environment between tasks
+    return _render_with(TemplateParser(config_dict), template_name, output_path)
+
+
+def _render_with(parser: TemplateParser, template_name: str, output_path: str) -> str:
+    if output_path is None:
+        return parser.render_file(template_name)
+
+    return parser.render_file_to(template_name, output_path)
@@ -0,0 +1,87 @@
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+
+class Profiler(object):
+
+    __stages = {}
+    __counters = {}
+
+    @classmethod
+    @contextmanager
+    def measure(cls, stage: str):
+        """Records the wall time spent in the wrapped block against the named stage"""
+        started_at = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+
+            (calls, total) = cls.__stages.get(stage, (0, 0.0))
+            cls.__stages[stage] = (calls + 1, total + elapsed)
+
+    @classmethod
+    def count(cls, counter: str, hit: bool = False) -> None:
+        """Records a call to a cached hot path, and whether it was answered from the cache"""
+        (calls, hits) = cls.__counters.get(counter, (0, 0))
+        cls.__counters[counter] = (calls + 1, hits + (1 if hit else 0))
+
+    @classmethod
+    def reset(cls) -> None:
+        cls.__stages = {}
+        cls.__counters = {}
+
+    @classmethod
+    def get_results(cls) -> dict:
+        return {
+            'stages': [
+                {'stage': stage, 'calls': calls, 'total_ms': round(total * 1000, 3)}
+                for (stage, (calls, total)) in cls.__stages.items()
+            ],
+            'counters': [
+                {'counter': counter, 'calls': calls, 'hits': hits}
+                for (counter, (calls, hits)) in cls.__counters.items()
+            ],
+        }
+
+    @classmethod
+    def format_table(cls) -> str:
+        results = cls.get_results()
+        lines = ['%-60s %8s %12s' % ('Stage', 'Calls', 'Total ms')]
+
+        for stage in results['stages']:
+            lines.append('%-60s %8d %12.2f' % (stage['stage'], stage['calls'], stage['total_ms']))
+
+        lines.append('')
+        lines.append('%-60s %8s %12s' % ('Counter', 'Calls', 'Cache hits'))
+
+        for counter in results['counters']:
+            lines.append('%-60s %8d %12d' % (counter['counter'], counter['calls'], counter['hits']))
+
+        return '\n'.join(lines)
+
+    @classmethod
+    def report(cls, args: list) -> None:
+        """Outputs the results as requested by the --profile and --timings-json=path options
+
+        A path of "-", or no path, writes the JSON results to stdout.
+        """
+        if "--profile" in args:
+            print('\n' + cls.format_table())
+
+        for arg in args:
+            if arg != '--timings-json' and not arg.startswith('--timings-json='):
+                continue
+
+            timings_json = json.dumps(cls.get_results(), indent=2)
+            file_path = arg[len('--timings-json='):]
+
+            # Without a path, the timings are written to stdout as with "-"
+            if file_path in ['', '-']:
+                sys.stdout.write(timings_json + '\n')
+            else:
+                with open(file_path, 'w') as timings_file:
+                    timings_file.write(timings_json)
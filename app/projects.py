@@ -0,0 +1,201 @@
+import io
+import os
+import glob
+import json
+import time
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from app.pool import RenderPool
+from app.profiler import Profiler
+from app.template import TemplateParser
+
+
+class ProjectFanout(object):
+
+    # Options which only apply to the process fanning the generation out
+    FANOUT_OPTIONS = ('--projects=', '--jobs=', '--pool=', '--timings-json')
+
+    @classmethod
+    def build(cls, generator, config_dict: dict, projects: str, args: list) -> bool:
+        """Generates one config into several projects, as the --projects option
+
+        The config is parsed and its templates are rendered once, then each project is
+        generated in its own worker process, up to --jobs (default one per core) at once.
+        Each project keeps its own manifest, staging directory and locks, and its output
+        is reported together once it's done.
+
+        :param generator: the generator class of the config
+        :param config_dict: the unparsed config
+        :param projects: the value of the --projects option, see collect_projects
+        :param args: the command line options to pass to each project's generator
+        :return: if the config was generated into every project successfully
+        """
+        try:
+            project_roots = cls.collect_projects(projects)
+            jobs = RenderPool.parse_jobs(generator.get_option(args, '--jobs', 'auto'))
+        except Exception as exception:
+            print('Could not read the projects, aborting:\n\n%s' % str(exception))
+            return False
+
+        try:
+            config_dict = generator.parse_config(config_dict)
+        except Exception as exception:
+            print('The following error detected was in was detected in your config file, please fix it and run the generator again:\n\n%s' % str(exception))
+            return False
+
+        started_at = time.time()
+
+        print('Rendering templates for %d project(s)...' % len(project_roots))
+
+        # Every project is generated from the same rendered templates
+        try:
+            rendered_templates = cls.__render_templates(generator, config_dict, jobs, args)
+        except Exception as exception:
+            print('The following error occured during template generation, aborting:\n\n%s' % str(exception))
+            return False
+
+        project_args = [arg for arg in args if not arg.startswith(cls.FANOUT_OPTIONS)]
+        workers = min(jobs, len(project_roots))
+
+        build_arguments = (
+            [generator] * len(project_roots),
+            [config_dict] * len(project_roots),
+            [rendered_templates] * len(project_roots),
+            project_roots,
+            [project_args] * len(project_roots),
+        )
+
+        # Projects are always built in worker processes, even one at a time, as building one
+        # seeds the rendered templates and resets the timings of the process it runs in
+        with Profiler.measure('project generation'):
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_build_project, *build_arguments))
+
+        for (index, result) in enumerate(results):
+            print('\n[%d/%d] %s (%s in %.2fs)' % (
+                index + 1, len(results), result['project'],
+                'done' if result['success'] else 'failed', result['duration']
+            ))
+
+            for line in result['output'].rstrip('\n').split('\n'):
+                print('    ' + line if line else '')
+
+        failed_projects = [result['project'] for result in results if not result['success']]
+
+        print('\nGenerated into %d of %d project(s) in %.2fs.' % (
+            len(results) - len(failed_projects), len(results), time.time() - started_at
+        ))
+
+        for failed_project in failed_projects:
+            print(' - failed: %s' % failed_project)
+
+        Profiler.report(args)
+
+        return len(failed_projects) == 0
+
+    @classmethod
+    def collect_projects(cls, projects: str) -> list:
+        """Expands the --projects option into the root directories of the projects
+
+        :param projects: comma separated project directories or glob patterns, or paths to
+                         projects manifests, JSON files listing them as {"projects": [...]}
+                         relative to the manifest
+        :return: the absolute path of each project, in the order given
+        """
+        project_roots = []
+
+        for source in projects.split(','):
+            patterns = [source]
+
+            if os.path.isfile(source):
+                patterns = cls.__read_manifest(source)
+
+            for pattern in patterns:
+                matched_paths = sorted(path for path in glob.glob(pattern) if os.path.isdir(path))
+
+                if len(matched_paths) == 0:
+                    raise(Exception('No project directories matched "%s".' % pattern))
+
+                for project_root in matched_paths:
+                    if os.path.abspath(project_root) not in project_roots:
+                        project_roots.append(os.path.abspath(project_root))
+
+        return project_roots
+
+    @classmethod
+    def __read_manifest(cls, manifest_path: str) -> list:
+        """Reads a projects manifest, returning its patterns relative to the current directory"""
+        with open(manifest_path, 'r') as manifest_file:
+            try:
+                manifest = json.loads(manifest_file.read())
+            except ValueError:
+                raise(Exception('Could not parse the projects manifest %s as JSON.' % manifest_path))
+
+        if not isinstance(manifest, dict) or not isinstance(manifest.get('projects'), list):
+            raise(Exception('The projects manifest %s must list the projects as {"projects": [...]}.' % manifest_path))
+
+        return [
+            os.path.join(os.path.dirname(manifest_path), pattern) for pattern in manifest['projects']
+        ]
+
+    @classmethod
+    def __render_templates(cls, generator, config_dict: dict, jobs: int, args: list) -> list:
+        """Renders every template of the generator in memory
+
+        :return: a nested array containing the name, source hash, input hash and output of each template
+        """
+        parser = TemplateParser(config_dict)
+        template_names = generator.get_template_names()
+
+        rendered_outputs = RenderPool.render(
+            config_dict,
+            [[template_name, None] for template_name in template_names],
+            jobs,
+            generator.get_option(args, '--pool', 'process')
+        )
+
+        return [
+            [
+                template_name,
+                TemplateParser.get_template_hash(template_name),
+                parser.get_input_hash(template_name),
+                rendered_output,
+            ]
+            for (template_name, rendered_output) in zip(template_names, rendered_outputs)
+        ]
+
+
+def _build_project(generator, config_dict: dict, rendered_templates: list, project_root: str, args: list) -> dict:
+    """Generates a config into a project from its rendered templates, capturing the generator's output
+
+    Paths such as the manifest and staging directory are relative to the project, so this
+    runs in a worker process with the project as its working directory. It must not run in
+    the parent process, whose timings and rendered templates it would replace.
+    """
+    started_at = time.time()
+    working_directory = os.getcwd()
+    output = io.StringIO()
+    success = False
+
+    for rendered_template in rendered_templates:
+        TemplateParser.add_rendered_template(*rendered_template)
+
+    # Timings are reported for each project on its own
+    Profiler.reset()
+
+    try:
+        os.chdir(project_root)
+
+        with contextlib.redirect_stdout(output):
+            success = generator.build_config(config_dict, args)
+    except Exception as exception:
+        output.write('Could not generate into the project, aborting:\n\n%s\n' % str(exception))
+    finally:
+        os.chdir(working_directory)
+
+    return {
+        'project': project_root,
+        'success': success,
+        'output': output.getvalue(),
+        'duration': time.time() - started_at,
+    }
@@ -1,153 +1,210 @@
 import os
+import copy
 import json
+import threading
 import jsonschema
+from app.profiler import Profiler
+from app.index import ConfigIndex
+from app.index import FrozenDict
+from app.index import IndexedConfig
+
+
+class ConfigValidationError(Exception):
+
+    def __init__(self, errors: list):
+        super().__init__('\n'.join(errors))
+        self.errors = errors
 
 
 class ConfigParser():
+    """Validates configs against their schema and fills in the defaults the schema annotates
+
+    A property's default is either the value of its "default" keyword, or copied from another
+    property of the same object with "defaultFrom", optionally transformed with
+    "defaultTransform". Defaults are found while the config is validated, so the config is
+    only walked once more, to build the normalized copy.
+    """
+
+    # Transforms which can be applied to a default copied with defaultFrom
+    DEFAULT_TRANSFORMS = {
+        'title': lambda text: text.replace('-', ' ').replace('_', ' ').title(),
+    }
+
+    __schema_cache = {}
+    __validator_cache = {}
+
+    # The defaults found by the validation running in each thread
+    __pending = threading.local()
 
     def parse(self, config: dict) -> dict:
-        self._validate_config(config)
+        """Validates the config and applies its default settings
 
-        return self._merge_default_settings(config)
+        :raises ConfigValidationError: if the config doesn't match the schema
+        :return: a normalized copy of the config, which can't be changed
+        """
+        # Configs which were already parsed, e.g. by the process generating into several projects, are kept
+        if isinstance(config, IndexedConfig):
+            return config
 
-    def _validate_config(self, config: dict) -> None:
-        jsonschema.validate(
-            config,
-            self._get_config_schema(config),
-        )
+        with Profiler.measure('schema validation'):
+            defaults = self._validate_config(config)
 
-    def _get_config_schema(self, config: dict) -> dict:
-        pass
+        with Profiler.measure('default merging'):
+            config = self.__normalize(config, defaults)
 
-    def _merge_default_settings(self, config: dict) -> dict:
-        pass
+        # Index the config once so templates can look up features, fields and names directly
+        with Profiler.measure('config indexing'):
+            return IndexedConfig(config, ConfigIndex.build(config))
 
+    def _validate_config(self, config: dict) -> dict:
+        """Validates the config against its schema, reporting every error at once
 
-class ModuleConfigParser(ConfigParser):
+        :raises ConfigValidationError: if the config doesn't match the schema
+        :return: the defaults of the properties missing from each object in the config, keyed by the object's id
+        """
+        validator = self.__get_validator(self._get_config_schema(config))
+
+        self.__pending.defaults = {}
+
+        try:
+            errors = sorted(
+                validator.iter_errors(config),
+                key=lambda error: [str(part) for part in error.absolute_path]
+            )
+
+            defaults = self.__pending.defaults
+        finally:
+            self.__pending.defaults = None
+
+        if len(errors) > 0:
+            raise(ConfigValidationError([
+                '%s: %s' % (
+                    '.'.join(str(part) for part in error.absolute_path) or 'config',
+                    error.message
+                )
+                for error in errors
+            ]))
+
+        return defaults
 
     def _get_config_schema(self, config: dict) -> dict:
-        file_path = os.path.join(
-            os.path.dirname(__file__),
-            'schema/module_config.json'
-        )
+        pass
 
-        with open(file_path, 'r') as schema_file:
-            return json.loads(schema_file.read())
+    def _load_schema(self, file_name: str) -> dict:
+        """Loads the named schema file, reusing it if it was already loaded in this process
 
-    def _merge_default_settings(self, config: dict) -> dict:
-        if 'fields' not in config:
-            config['fields'] = []
+        :param file_name: the name of the schema file within the schema directory
+        :return: the parsed schema
+        """
+        if file_name not in self.__schema_cache:
+            file_path = os.path.join(
+                os.path.dirname(__file__),
+                'schema',
+                file_name
+            )
 
-        # Field defaults
+            with open(file_path, 'r') as schema_file:
+                self.__schema_cache[file_name] = json.loads(schema_file.read())
 
-        for field in config['fields']:
-            if 'label' not in field:
-                field['label'] = field['name']
+        return self.__schema_cache[file_name]
 
-            if 'show_on_admin_index' not in field:
-                field['show_on_admin_index'] = False
+    def __get_validator(self, schema: dict):
+        """Returns a validator for the schema which also finds its defaults, checking the schema itself only the first time it is used"""
+        if id(schema) not in self.__validator_cache:
+            validator_class = jsonschema.validators.validator_for(schema)
+            validator_class.check_schema(schema)
 
-            default_rules = {
-                'required': False,
-                'nullable': False,
-            }
+            validator_class = jsonschema.validators.extend(validator_class, {
+                'properties': self.__create_properties_validator(validator_class.VALIDATORS['properties']),
+            })
 
-            if 'rules' not in field:
-                field['rules'] = default_rules
-            else:
-                for rule_key in default_rules:
-                    if rule_key not in field['rules']:
-                        field['rules'][rule_key] = default_rules[rule_key]
+            # The schema is kept alongside its validator so its id can't be reused
+            self.__validator_cache[id(schema)] = (schema, validator_class(schema))
 
-            # Type specific defaults
+        return self.__validator_cache[id(schema)][1]
 
-            if field['type'] == 'media':
-                if 'conversions' not in field['options']:
-                    field['options']['conversions'] = []
+    @classmethod
+    def __create_properties_validator(cls, validate_properties):
+        """Extends the properties keyword to record the defaults of the properties an object is missing
 
-        # Feature defaults
+        Only properties whose subschema applies get their defaults, e.g. the options of a
+        feature in the "then" of its type. The defaults are recorded rather than set, so they
+        can't satisfy a "required" keyword, and the config being validated isn't changed.
+        """
+        def validate(validator, properties: dict, instance, schema: dict):
+            for error in validate_properties(validator, properties, instance, schema):
+                yield error
 
-        if 'features' not in config:
-            config['features'] = []
+            defaults = getattr(cls.__pending, 'defaults', None)
 
-        for feature in config['features']:
-            if 'options' not in feature:
-                feature['options'] = {}
+            if defaults is None or not validator.is_type(instance, 'object'):
+                return
 
-            options = feature['options']
+            for (name, subschema) in properties.items():
+                if name in instance or not isinstance(subschema, dict):
+                    continue
 
-            if (
-                feature['type'] == 'sort' and
-                'order_column_name' not in options
-            ):
-                options['order_column_name'] = 'order'
+                (owner, values) = defaults.get(id(instance), (instance, {}))
 
-            if feature['type'] == 'media':
-                for media_group in options['media_groups']:
-                    if 'conversions' not in media_group:
-                        media_group['conversions'] = []
+                if name not in values:
+                    default = cls.__get_default(subschema, instance)
 
-                if 'conversions' not in options:
-                    options['conversions'] = []
+                    if default is None:
+                        continue
 
-            if (
-                feature['type'] == 'draft' and
-                'published_at_column_name' not in options
-            ):
-                options['published_at_column_name'] = 'published_at'
+                    values[name] = default
+                    defaults[id(instance)] = (owner, values)
 
-        return config
+                # Defaults can have defaults of their own, e.g. the column names in a feature's options.
+                # Values copied with defaultFrom aren't checked again, as their errors are reported
+                # where the user wrote them
+                if 'default' in subschema:
+                    for error in validator.descend(values[name], subschema, path=name):
+                        yield error
 
+        return validate
 
-class PageTemplateConfigParser(ConfigParser):
+    @classmethod
+    def __get_default(cls, subschema: dict, instance: dict):
+        if 'default' in subschema:
+            return copy.deepcopy(subschema['default'])
 
-    def _get_config_schema(self, config: dict) -> dict:
-        file_path = os.path.join(
-            os.path.dirname(__file__),
-            'schema/page_template_config.json'
-        )
+        if subschema.get('defaultFrom') not in instance:
+            return None
+
+        default = instance[subschema['defaultFrom']]
 
-        with open(file_path, 'r') as schema_file:
-            return json.loads(schema_file.read())
+        if 'defaultTransform' in subschema:
+            default = cls.DEFAULT_TRANSFORMS[subschema['defaultTransform']](default)
 
-    def _merge_default_settings(self, config: dict) -> dict:
-        if 'name' not in config:
-            config['name'] = self.__convert_to_title(config['id'])
+        return default
 
-        if 'fields' not in config:
-            config['fields'] = []
+    @classmethod
+    def __normalize(cls, value, defaults: dict):
+        """Copies a validated value into read only dicts and tuples, adding the defaults found while validating it"""
+        if isinstance(value, dict):
+            normalized = dict(
+                (key, cls.__normalize(item, defaults)) for (key, item) in value.items()
+            )
 
-        if 'conversions' not in config:
-            config['conversions'] = []
+            for (key, default) in defaults.get(id(value), (value, {}))[1].items():
+                normalized[key] = cls.__normalize(default, defaults)
 
-        # Field defaults
+            return FrozenDict(normalized)
 
-        for field in config['fields']:
-            if 'label' not in field:
-                config['label'] = self.__convert_to_title(field['name'])
+        if isinstance(value, list):
+            return tuple(cls.__normalize(item, defaults) for item in value)
 
-            default_rules = {
-                'required': False,
-                'nullable': False
-            }
+        return value
 
-            if 'rules' not in field:
-                field['rules'] = default_rules
-            else:
-                for rule_key in default_rules:
-                    if rule_key not in field['rules']:
-                        field['rules'][rule_key] = default_rules[rule_key]
 
-            # Type specific defaults
+class ModuleConfigParser(ConfigParser):
 
-            if field['type'] == 'media':
-                if 'conversions' not in field['options']:
-                    field['options']['conversions'] = []
+    def _get_config_schema(self, config: dict) -> dict:
+        return self._load_schema('module_config.json')
 
-        return config
 
-    def __convert_to_title(self, string: str):
-        for separator in ['-', '_']:
-            string = string.replace(separator, ' ')
+class PageTemplateConfigParser(ConfigParser):
 
-        return string.title()
+    def _get_config_schema(self, config: dict) -> dict:
+        return self._load_schema('page_template_config.json')
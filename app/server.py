@@ -0,0 +1,174 @@
+import io
+import os
+import json
+from contextlib import redirect_stdout
+from app.generators import GENERATORS
+from app.schema import ConfigValidationError
+
+
+class RpcError(Exception):
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class RpcServer(object):
+
+    PARSE_ERROR = -32700
+    INVALID_REQUEST = -32600
+    METHOD_NOT_FOUND = -32601
+    INVALID_PARAMS = -32602
+    GENERATION_ERROR = -32000
+
+    def __init__(self):
+        self.__methods = {
+            'generate': self.generate,
+            'validate': self.validate,
+            'preview': self.preview,
+            'shutdown': self.shutdown,
+        }
+
+        self.__running = False
+
+    def serve(self, input_stream, output_stream) -> None:
+        """Answers newline delimited JSON-RPC 2.0 requests until the input closes or shutdown is requested
+
+        The template environment, compiled templates and config schemas stay loaded
+        between requests, so only the first request pays for loading them.
+
+        :param input_stream: the stream to read requests from, one per line
+        :param output_stream: the stream to write responses to, one per line
+        """
+        self.__running = True
+
+        for line in input_stream:
+            if line.strip() == '':
+                continue
+
+            response = self.handle(line)
+
+            if response is not None:
+                output_stream.write(json.dumps(response) + '\n')
+                output_stream.flush()
+
+            if not self.__running:
+                break
+
+    def handle(self, line: str) -> dict:
+        """Handles a single JSON-RPC request
+
+        :return: the response, or None if the request was a notification
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as exception:
+            return self.__error_response(None, self.PARSE_ERROR, str(exception))
+
+        if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+            return self.__error_response(None, self.INVALID_REQUEST, 'Invalid request')
+
+        request_id = request.get('id')
+
+        try:
+            if request['method'] not in self.__methods:
+                raise(RpcError(self.METHOD_NOT_FOUND, 'Method "%s" not found' % request['method']))
+
+            params = request.get('params', {})
+
+            if not isinstance(params, dict):
+                raise(RpcError(self.INVALID_PARAMS, 'Params must be an object'))
+
+            result = self.__methods[request['method']](params)
+        except RpcError as exception:
+            response = self.__error_response(request_id, exception.code, str(exception))
+        except Exception as exception:
+            response = self.__error_response(request_id, self.GENERATION_ERROR, str(exception))
+        else:
+            response = {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+        # Notifications are never answered, even when they fail
+        if 'id' not in request:
+            return None
+
+        return response
+
+    def generate(self, params: dict) -> dict:
+        """Generates the project files for a config, as the generate:module and generate:page commands do
+
+        Params: "type" (module or page), "config" (an object or a path), optional "options"
+        (a list of command line options) and optional "cwd" (the project directory).
+        """
+        generator = self.__get_generator(params)
+        options = params.get('options', [])
+        output = io.StringIO()
+
+        previous_directory = os.getcwd()
+
+        try:
+            os.chdir(params.get('cwd', previous_directory))
+
+            # Progress messages would corrupt the response stream, so return them instead
+            with redirect_stdout(output):
+                success = generator.build_config(self.__get_config(params), options)
+        finally:
+            os.chdir(previous_directory)
+
+        return {'success': success, 'output': output.getvalue()}
+
+    def validate(self, params: dict) -> dict:
+        """Validates a config, returning any errors found in it
+
+        Params: "type" (module or page) and "config" (an object or a path).
+        """
+        generator = self.__get_generator(params)
+
+        try:
+            generator.parse_config(self.__get_config(params))
+        except ConfigValidationError as exception:
+            return {'valid': False, 'errors': exception.errors}
+        except Exception as exception:
+            return {'valid': False, 'errors': [str(exception)]}
+
+        return {'valid': True, 'errors': []}
+
+    def preview(self, params: dict) -> dict:
+        """Renders the files for a config without writing anything to the project
+
+        Params: "type" (module or page) and "config" (an object or a path).
+        """
+        generator = self.__get_generator(params)
+
+        config_dict = generator.parse_config(self.__get_config(params))
+
+        return {'files': generator.preview(config_dict)}
+
+    def shutdown(self, params: dict) -> dict:
+        self.__running = False
+
+        return {}
+
+    def __get_generator(self, params: dict):
+        if params.get('type') not in GENERATORS:
+            raise(RpcError(self.INVALID_PARAMS, 'The "type" param must be one of: %s' % ', '.join(GENERATORS)))
+
+        return GENERATORS[params['type']]
+
+    def __get_config(self, params: dict) -> dict:
+        config = params.get('config')
+
+        if isinstance(config, str):
+            with open(config, 'r') as config_file:
+                return json.loads(config_file.read())
+
+        if not isinstance(config, dict):
+            raise(RpcError(self.INVALID_PARAMS, 'The "config" param must be an object or a file path'))
+
+        return config
+
+    def __error_response(self, request_id, code: int, message: str) -> dict:
+        return {
+            'jsonrpc': '2.0',
+            'id': request_id,
+            'error': {'code': code, 'message': message},
+        }
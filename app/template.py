@@ -1,12 +1,23 @@
 import json
 import os
+import hashlib
+import shutil
 import re
-import inflection
+import jinja2
 
+from collections import OrderedDict
 from functools import reduce
 
-from jinja2 import BaseLoader
+from app import config
+from app.cache import RenderCache
+from app.dependencies import TemplateDependencies
+from app.filters import TemplateFilters
+from app.index import ConfigIndex
+from app.profiler import Profiler
 from jinja2 import Environment
+from jinja2 import FileSystemBytecodeCache
+from jinja2 import FileSystemLoader
+from jinja2 import ModuleLoader
 from jinja2 import Template
 from jinja2 import nodes
 from jinja2.ext import Extension
@@ -14,137 +25,402 @@ from jinja2.ext import Extension
 
 class TemplateParser(object):
 
-    def __init__(self, config_dict: dict):
+    # Number of characters of rendered output held in memory before it's written out
+    STREAM_BUFFER_SIZE = 65536
+
+    # Number of compiled path strings kept, as some paths (e.g. migrations) embed the time they're generated
+    STRING_CACHE_SIZE = 256
+
+    __environment = None
+    __precompiled_environment = None
+    __precompiled_templates = None
+    __string_cache = OrderedDict()
+    __template_hashes = {}
+    __rendered_templates = {}
+
+    def __init__(self, config_dict: dict, use_cache: bool = True):
         self.__config_dict = config_dict
+        # Parsers which mustn't write to the cache directory, e.g. for the python API, skip the render cache
+        self.__use_cache = use_cache
+        self.__input_hashes = {}
+        self.__index = ConfigIndex.get(config_dict)
+        self.__helpers = TemplateHelpers(config_dict, self.__index)
+
+    @classmethod
+    def get_environment(cls) -> Environment:
+        """Returns the jinja2 environment shared by every parser in this process
+
+        Templates are loaded from the template directory and kept compiled in
+        memory, with their bytecode persisted to the cache directory so later
+        runs can skip compilation altogether.
+
+        :return: the shared jinja2 environment
+        """
+        if cls.__environment is None:
+            cls.__environment = cls.__create_environment(
+                FileSystemLoader(config.TEMPLATE_DIR), cls.__create_bytecode_cache()
+            )
+
+        return cls.__environment
+
+    @classmethod
+    def get_compiled_template(cls, template_name: str) -> Template:
+        """Returns the compiled template with the provided name
+
+        Templates precompiled by the templates:compile command are imported rather than
+        compiled, unless their source has changed since they were precompiled.
+        """
+        precompiled_templates = cls.__get_precompiled_templates()
+
+        if (
+            template_name in precompiled_templates and
+            precompiled_templates[template_name]['hash'] == cls.get_template_hash(template_name)
+        ):
+            return cls.__precompiled_environment.get_template(template_name)
+
+        return cls.get_environment().get_template(template_name)
+
+    @classmethod
+    def compile_templates(cls, use_zip: bool = False) -> None:
+        """Compiles every template into python modules, as the templates:compile command
+
+        The modules are written to the compiled template path, or a zip file beside it,
+        along with the source hash and dependencies of each template.
+
+        :param use_zip: if the modules should be written to a zip file
+        """
+        environment = cls.get_environment()
+        template_names = environment.list_templates(extensions=['j2'])
+
+        # Remove the previous compilation, which may have been in the other format
+        if os.path.isdir(config.COMPILED_TEMPLATE_PATH):
+            shutil.rmtree(config.COMPILED_TEMPLATE_PATH)
+
+        for file_path in [config.COMPILED_TEMPLATE_PATH + '.zip', config.COMPILED_TEMPLATE_PATH + '.json']:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+
+        # The zip file is written straight into the build directory, which jinja2 doesn't create
+        os.makedirs(os.path.dirname(config.COMPILED_TEMPLATE_PATH), exist_ok=True)
+
+        environment.compile_templates(
+            config.COMPILED_TEMPLATE_PATH + ('.zip' if use_zip else ''),
+            extensions=['j2'],
+            zip='deflated' if use_zip else None,
+            ignore_errors=False
+        )
+
+        precompiled_templates = {}
+
+        for template_name in template_names:
+            template_hash = cls.get_template_hash(template_name)
+
+            precompiled_templates[template_name] = {
+                'hash': template_hash,
+                'dependencies': TemplateDependencies.get(environment, template_name, template_hash),
+            }
 
-        self.__environment = Environment(
-            loader=BaseLoader,
+        # Written last, so templates are only loaded from a complete compilation
+        with open(config.COMPILED_TEMPLATE_PATH + '.json', 'w') as precompiled_file:
+            precompiled_file.write(json.dumps({
+                'jinja': jinja2.__version__,
+                'templates': precompiled_templates,
+            }, indent=2, sort_keys=True))
+
+        print('Compiled %d templates to %s.' % (
+            len(template_names), config.COMPILED_TEMPLATE_PATH + ('.zip' if use_zip else '')
+        ))
+
+    @classmethod
+    def __get_precompiled_templates(cls) -> dict:
+        """Loads the templates compiled by the templates:compile command, once per process
+
+        :return: the source hash and dependencies of each precompiled template, by name
+        """
+        if cls.__precompiled_templates is not None:
+            return cls.__precompiled_templates
+
+        cls.__precompiled_templates = {}
+
+        module_path = config.COMPILED_TEMPLATE_PATH
+
+        if not os.path.isdir(module_path):
+            module_path += '.zip'
+
+        if not os.path.exists(module_path) or not os.path.isfile(config.COMPILED_TEMPLATE_PATH + '.json'):
+            return cls.__precompiled_templates
+
+        with open(config.COMPILED_TEMPLATE_PATH + '.json', 'r') as precompiled_file:
+            compilation = json.loads(precompiled_file.read())
+
+        # Compiled templates only run on the version of jinja2 which compiled them
+        if compilation.get('jinja') != jinja2.__version__:
+            return cls.__precompiled_templates
+
+        precompiled_templates = compilation['templates']
+
+        cls.__precompiled_environment = cls.__create_environment(ModuleLoader(module_path))
+
+        # Templates are analysed when they're compiled, so their sources needn't be parsed at all
+        for (template_name, precompiled_template) in precompiled_templates.items():
+            TemplateDependencies.add(
+                template_name,
+                precompiled_template['hash'],
+                [tuple(path) for path in precompiled_template['dependencies']]
+            )
+
+        cls.__precompiled_templates = precompiled_templates
+
+        return cls.__precompiled_templates
+
+    @classmethod
+    def __create_environment(cls, loader, bytecode_cache=None) -> Environment:
+        environment = Environment(
+            loader=loader,
+            bytecode_cache=bytecode_cache,
             trim_blocks=True,
             lstrip_blocks=True,
         )
 
-        self.__filters = TemplateFilters()
-        self.__helpers = TemplateHelpers(self.__config_dict)
-
-        self.__environment.filters = {
-            **self.__environment.filters,
-            'camel': self.__filters.camel,
-            'kebab': self.__filters.kebab,
-            'snake': self.__filters.snake,
-            'pascal': self.__filters.pascal,
-            'plural': self.__filters.plural,
-            'singular': self.__filters.singular
+        filters = TemplateFilters()
+
+        environment.filters = {
+            **environment.filters,
+            'camel': filters.camel,
+            'kebab': filters.kebab,
+            'snake': filters.snake,
+            'pascal': filters.pascal,
+            'plural': filters.plural,
+            'singular': filters.singular
         }
 
-    def render_file(self, file_path: str) -> str:
-        """Renders the contents of the file at the provided file path
+        return environment
 
-        :param file_path: the path of the jinja2 file to render
-        :return: the rendered template
+    @classmethod
+    def __create_bytecode_cache(cls):
+        cache_directory = os.path.join(config.CACHE_DIR, 'bytecode')
+
+        # Fall back to in-memory compilation if the cache can't be created
+        try:
+            os.makedirs(cache_directory, exist_ok=True)
+        except OSError:
+            return None
+
+        return FileSystemBytecodeCache(cache_directory)
+
+    @classmethod
+    def get_template_source(cls, template_name: str) -> str:
+        """Returns the unrendered source of the template with the provided name"""
+        environment = cls.get_environment()
+
+        return environment.loader.get_source(environment, template_name)[0]
+
+    @classmethod
+    def get_template_hash(cls, template_name: str) -> str:
+        """Returns the sha1 hash of the template's source, hashing it again only once the file changes"""
+        if template_name in cls.__template_hashes:
+            (template_hash, is_up_to_date) = cls.__template_hashes[template_name]
+
+            if is_up_to_date():
+                return template_hash
+
+        environment = cls.get_environment()
+        (source, file_path, is_up_to_date) = environment.loader.get_source(environment, template_name)
+
+        template_hash = hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+        cls.__template_hashes[template_name] = (template_hash, is_up_to_date)
+
+        return template_hash
+
+    @classmethod
+    def get_partials_hash(cls, directory: str) -> str:
+        """Returns a hash of the sources of every partial in a directory, which changes when any of them do"""
+        prefix = directory.rstrip('/') + '/'
+
+        return hashlib.sha1(''.join(
+            '%s:%s\n' % (template_name, cls.get_template_hash(template_name))
+            for template_name in cls.get_environment().list_templates()
+            if template_name.startswith(prefix)
+        ).encode('utf-8')).hexdigest()
+
+    def get_config(self) -> dict:
+        return self.__config_dict
+
+    def get_input_hash(self, template_name: str) -> str:
+        """Returns the hash of only the parts of the config the template reads
+
+        Changes to the config which don't change the hash can't change the rendered template.
         """
-        with open(file_path, 'r') as template_file:
-            template_contents = template_file.read()
+        if template_name not in self.__input_hashes:
+            dependencies = TemplateDependencies.get(
+                self.get_environment(), template_name, self.get_template_hash(template_name)
+            )
 
-        compiled_template = self.__environment.from_string(template_contents)
+            with Profiler.measure('input hashing'):
+                partial_hashes = {
+                    path[1]: self.get_partials_hash(path[1]) for path in dependencies if path[0] == 'partials'
+                }
 
-        return compiled_template.render(
-            self.__config_dict,
-            in_array=self.__helpers.in_array,
-            has_feature=self.__helpers.has_feature,
-            get_model_traits=self.__helpers.get_model_traits,
-            get_model_parents=self.__helpers.get_model_parents
-        )
+                self.__input_hashes[template_name] = TemplateDependencies.fingerprint(
+                    dependencies, self.__config_dict, self.__index, partial_hashes
+                )
 
-    def render_string(self, to_render: str) -> str:
-        """Renders the provided string as a jinja2 template
+        return self.__input_hashes[template_name]
 
-        :param to_render: the string to render
-        :return: the rendered string
+    def render_file(self, template_name: str) -> str:
+        """Renders the template with the provided name
+
+        :param template_name: the path of the jinja2 file to render, relative to the template directory
+        :return: the rendered template
         """
-        compiled_string = self.__environment.from_string(to_render)
+        rendered_template = self.__get_rendered_template(template_name)
+
+        if rendered_template is not None:
+            return rendered_template
 
-        return compiled_string.render(self.__config_dict)
+        cache_key = self.__get_cache_key(template_name)
 
+        if cache_key is not None:
+            rendered_template = RenderCache.get(cache_key)
 
-class TemplateFilters(object):
+            if rendered_template is not None:
+                return rendered_template
 
-    def __init__(self):
-        self.__camel_cache = {}
-        self.__kebab_cache = {}
-        self.__snake_cache = {}
-        self.__pascal_cache = {}
-        self.__plural_cache = {}
-        self.__singular_cache = {}
+        with Profiler.measure('template compile'):
+            compiled_template = self.get_compiled_template(template_name)
 
-    def plural(self, text: str) -> str:
-        if text in self.__plural_cache:
-            return self.__plural_cache[text]
+        with Profiler.measure('render: %s' % template_name):
+            rendered_template = compiled_template.render(
+                self.__config_dict,
+                index=self.__index,
+                in_array=self.__helpers.in_array,
+                has_feature=self.__helpers.has_feature,
+                get_model_traits=self.__helpers.get_model_traits,
+                get_model_parents=self.__helpers.get_model_parents,
+                render_fields=self.__helpers.render_fields
+            )
 
-        plural_text = inflection.pluralize(text)
+        if cache_key is not None:
+            RenderCache.put(cache_key, rendered_template)
 
-        self.__plural_cache[text] = plural_text
+        return rendered_template
 
-        return plural_text
+    def render_file_to(self, template_name: str, file_path: str) -> str:
+        """Renders the template with the provided name, streaming the output to a file as it's produced
 
-    def singular(self, text: str) -> str:
-        if text in self.__singular_cache:
-            return self.__singular_cache[text]
+        :param template_name: the path of the jinja2 file to render, relative to the template directory
+        :param file_path: the path of the file to write the rendered template to
+        :return: the sha1 hash of the rendered template
+        """
+        rendered_template = self.__get_rendered_template(template_name)
+        cache_key = None
 
-        singular_text = inflection.singularize(text)
+        if rendered_template is None:
+            cache_key = self.__get_cache_key(template_name)
 
-        self.__singular_cache[text] = singular_text
+        if cache_key is not None:
+            rendered_template = RenderCache.get(cache_key)
 
-        return singular_text
+        if rendered_template is not None:
+            with open(file_path, 'w') as rendered_file:
+                rendered_file.write(rendered_template)
 
-    def camel(self, text: str) -> str:
-        if text in self.__camel_cache:
-            return self.__camel_cache[text]
+            return hashlib.sha1(rendered_template.encode('utf-8')).hexdigest()
 
-        words = text.lower().split(' ')
+        with Profiler.measure('template compile'):
+            compiled_template = self.get_compiled_template(template_name)
 
-        camel_text = words[0] + ''.join(
-            word.capitalize() for word in words[1:]
-        )
+        rendered_hash = hashlib.sha1()
+        buffered_chunks = []
+        buffered_length = 0
 
-        self.__camel_cache[text] = camel_text
+        with open(file_path, 'w') as rendered_file, Profiler.measure('render: %s' % template_name):
+            for chunk in compiled_template.generate(
+                self.__config_dict,
+                index=self.__index,
+                in_array=self.__helpers.in_array,
+                has_feature=self.__helpers.has_feature,
+                get_model_traits=self.__helpers.get_model_traits,
+                get_model_parents=self.__helpers.get_model_parents,
+                render_fields=self.__helpers.render_fields
+            ):
+                buffered_chunks.append(chunk)
+                buffered_length += len(chunk)
 
-        return camel_text
+                # Jinja yields many tiny chunks, so write and hash them in bounded batches
+                if buffered_length >= self.STREAM_BUFFER_SIZE:
+                    self.__flush_chunks(buffered_chunks, rendered_file, rendered_hash)
+                    buffered_chunks = []
+                    buffered_length = 0
 
-    def kebab(self, text: str) -> str:
-        if text in self.__kebab_cache:
-            return self.__kebab_cache[text]
+            self.__flush_chunks(buffered_chunks, rendered_file, rendered_hash)
 
-        kebab_text = text.lower().replace(' ', '-')
+        if cache_key is not None:
+            RenderCache.put_file(cache_key, file_path)
 
-        self.__kebab_cache[text] = kebab_text
+        return rendered_hash.hexdigest()
 
-        return kebab_text
+    def __flush_chunks(self, chunks: list, rendered_file, rendered_hash) -> None:
+        text = ''.join(chunks)
 
-    def pascal(self, text: str) -> str:
-        if text in self.__pascal_cache:
-            return self.__pascal_cache[text]
+        rendered_file.write(text)
+        rendered_hash.update(text.encode('utf-8'))
 
-        pascal_text = text.replace(' ', '')
+    @classmethod
+    def add_rendered_template(cls, template_name: str, template_hash: str, input_hash: str, contents: str) -> None:
+        """Provides the output of a template rendered elsewhere, e.g. by the process generating a config into several projects
 
-        self.__pascal_cache[text] = pascal_text
+        It's used by every parser whose config gives the template the same input hash.
+        """
+        cls.__rendered_templates[(template_name, template_hash, input_hash)] = contents
 
-        return pascal_text
+    def __get_rendered_template(self, template_name: str) -> str:
+        if len(self.__rendered_templates) == 0:
+            return None
 
-    def snake(self, text: str) -> str:
-        if text in self.__snake_cache:
-            return self.__snake_cache[text]
+        return self.__rendered_templates.get(
+            (template_name, self.get_template_hash(template_name), self.get_input_hash(template_name))
+        )
 
-        snake_text = text.lower().replace(' ', '_')
+    def __get_cache_key(self, template_name: str) -> str:
+        """Returns the key of the template's output in the render cache, or None if the cache is disabled"""
+        if not self.__use_cache or not RenderCache.is_enabled():
+            return None
 
-        self.__snake_cache[text] = snake_text
+        return RenderCache.get_key(self.get_template_hash(template_name), self.get_input_hash(template_name))
 
-        return snake_text
+    def render_string(self, to_render: str) -> str:
+        """Renders the provided string as a jinja2 template
+
+        :param to_render: the string to render
+        :return: the rendered string
+        """
+        compiled_string = self.__string_cache.get(to_render)
+
+        if compiled_string is None:
+            with Profiler.measure('template compile'):
+                compiled_string = self.get_environment().from_string(to_render)
+
+            self.__string_cache[to_render] = compiled_string
+
+            if len(self.__string_cache) > self.STRING_CACHE_SIZE:
+                self.__string_cache.popitem(last=False)
+        else:
+            self.__string_cache.move_to_end(to_render)
+
+        with Profiler.measure('render: destination paths'):
+            return compiled_string.render(
+                self.__config_dict,
+                index=self.__index
+            )
 
 
 class TemplateHelpers(object):
-    def __init__(self, config_dict: dict):
+
+    def __init__(self, config_dict: dict, index: dict):
         self.__config_dict = config_dict
-        self.__feature_cache = {}
+        self.__index = index
 
     def get_model_parents(self):
         parents = []
@@ -177,19 +453,65 @@ class TemplateHelpers(object):
         return ','.join(traits)
 
     def has_feature(self, feature_type: str) -> bool:
-        if feature_type in self.__feature_cache:
-            return self.__feature_cache[feature_type]
-    
-        matching_features = list(
-            filter(lambda feature: feature['type'] ==
-                   feature_type, self.__config_dict['features'])
+        # Counted for its calls only, as it's a lookup in the config index rather than a cache
+        Profiler.count('helper: has_feature')
+
+        return feature_type in self.__index['features']
+
+    def in_array(self, text: str, array: list) -> bool:
+        return text in array
+
+    def render_fields(self, directory: str) -> dict:
+        """Renders every field of the config through the partial for its type
+
+        Each partial, e.g. module/front/fields/text.vue.j2, defines a macro per section of
+        the template the field appears in. The fragments are rendered as they're iterated,
+        so templates rendered to a file still stream their output.
+
+        :param directory: the directory of the partials, relative to the template directory
+        :return: the fragments of the fields in order, keyed by macro name
+        """
+        fields = self.__config_dict.get('fields', [])
+        partials = {}
+        macro_names = []
+
+        for field in fields:
+            if field['type'] in partials:
+                continue
+
+            template_name = '%s/%s.vue.j2' % (directory, field['type'])
+
+            try:
+                partials[field['type']] = (template_name, TemplateParser.get_compiled_template(template_name).module)
+            except jinja2.TemplateNotFound:
+                raise(Exception('There is no partial for fields of type "%s" in %s' % (field['type'], directory)))
+
+            for (name, macro) in vars(partials[field['type']][1]).items():
+                if not name.startswith('_') and callable(macro) and name not in macro_names:
+                    macro_names.append(name)
+
+        return dict(
+            (macro_name, FieldFragments(fields, partials, macro_name)) for macro_name in macro_names
         )
 
-        module_has_feature = len(matching_features) != 0
 
-        self.__feature_cache[feature_type] = module_has_feature
+class FieldFragments(object):
+    """The fragments one macro of the field partials renders for each field, rendered as they're iterated"""
 
-        return module_has_feature
+    def __init__(self, fields: list, partials: dict, macro_name: str):
+        self.__fields = fields
+        self.__partials = partials
+        self.__macro_name = macro_name
 
-    def in_array(self, text: str, array: list) -> bool:
-        return text in array
+    def __iter__(self):
+        for field in self.__fields:
+            (template_name, module) = self.__partials[field['type']]
+            macro = getattr(module, self.__macro_name, None)
+
+            if macro is None:
+                continue
+
+            with Profiler.measure('render: %s' % template_name):
+                fragment = str(macro(field))
+
+            yield fragment
@@ -0,0 +1,262 @@
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+from app import config
+from app.batch import BatchGenerator
+from app.generators import Generator
+from app.profiler import Profiler
+
+
+class PollingObserver(object):
+    """Detects changes by comparing the size and modification time of the watched files"""
+
+    # Seconds between scans of the watched files
+    INTERVAL = 0.25
+
+    def __init__(self, file_paths: list, directories: list):
+        self.__file_paths = file_paths
+        self.__directories = directories
+        self.__snapshot = self.__take_snapshot()
+
+    def wait(self, timeout: float = None) -> set:
+        """Waits for the watched files to change
+
+        :param timeout: the maximum number of seconds to wait, or None to wait until something changes
+        :return: the paths of the changed files, which is empty if the timeout passed first
+        """
+        started_at = time.monotonic()
+
+        while True:
+            snapshot = self.__take_snapshot()
+
+            changed_paths = set(
+                file_path for file_path in set(snapshot) | set(self.__snapshot)
+                if snapshot.get(file_path) != self.__snapshot.get(file_path)
+            )
+
+            self.__snapshot = snapshot
+
+            if len(changed_paths) > 0:
+                return changed_paths
+
+            if timeout is not None and time.monotonic() - started_at >= timeout:
+                return changed_paths
+
+            time.sleep(self.INTERVAL)
+
+    def __take_snapshot(self) -> dict:
+        snapshot = {}
+
+        file_paths = list(self.__file_paths)
+
+        for directory in self.__directories:
+            for (current_directory, directories, file_names) in os.walk(directory):
+                file_paths += [os.path.join(current_directory, file_name) for file_name in file_names]
+
+        for file_path in file_paths:
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                continue
+
+            snapshot[file_path] = (file_stat.st_mtime_ns, file_stat.st_size)
+
+        return snapshot
+
+
+class InotifyObserver(object):
+    """Detects changes with Linux's inotify, which avoids scanning the watched files"""
+
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, file_paths: list, directories: list):
+        """
+        :raises OSError: if inotify isn't available
+        """
+        library_path = ctypes.util.find_library('c')
+
+        if not sys.platform.startswith('linux') or library_path is None:
+            raise(OSError('inotify is only available on Linux'))
+
+        self.__libc = ctypes.CDLL(library_path, use_errno=True)
+        self.__file_descriptor = self.__libc.inotify_init1(self.IN_CLOEXEC)
+
+        if self.__file_descriptor < 0:
+            raise(OSError(ctypes.get_errno(), 'Could not initialise inotify'))
+
+        self.__watched_directories = {}
+        self.__recursive_directories = [os.path.join(directory, '') for directory in directories]
+
+        # Editors often save by replacing the file, so watch the directories containing the files
+        for file_path in file_paths:
+            self.__add_watch(os.path.dirname(file_path) or '.')
+
+        for directory in directories:
+            for (current_directory, subdirectories, file_names) in os.walk(directory):
+                self.__add_watch(current_directory)
+
+    def wait(self, timeout: float = None) -> set:
+        """Waits for the watched files to change
+
+        :param timeout: the maximum number of seconds to wait, or None to wait until something changes
+        :return: the paths of the changed files, which is empty if the timeout passed first
+        """
+        (readable, writable, errored) = select.select([self.__file_descriptor], [], [], timeout)
+
+        if len(readable) == 0:
+            return set()
+
+        changed_paths = set()
+        events = os.read(self.__file_descriptor, 65536)
+        offset = 0
+
+        while offset < len(events):
+            (watch_descriptor, mask, cookie, name_length) = self.EVENT_HEADER.unpack_from(events, offset)
+            offset += self.EVENT_HEADER.size
+
+            name = events[offset:offset + name_length].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += name_length
+
+            directory = self.__watched_directories.get(watch_descriptor)
+
+            if directory is None or name == '':
+                continue
+
+            changed_path = os.path.join(directory, name)
+
+            if mask & self.IN_ISDIR:
+                # Watch directories created inside the watched directories, such as a new template folder
+                if mask & self.IN_CREATE and any(
+                    changed_path.startswith(directory) for directory in self.__recursive_directories
+                ):
+                    try:
+                        self.__add_watch(changed_path)
+                    except OSError:
+                        # The directory was removed again before it could be watched
+                        pass
+
+                continue
+
+            changed_paths.add(changed_path)
+
+        return changed_paths
+
+    def __add_watch(self, directory: str) -> None:
+        if directory in self.__watched_directories.values():
+            return
+
+        watch_descriptor = self.__libc.inotify_add_watch(
+            self.__file_descriptor,
+            directory.encode('utf-8'),
+            self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        )
+
+        if watch_descriptor < 0:
+            raise(OSError(ctypes.get_errno(), 'Could not watch %s' % directory))
+
+        self.__watched_directories[watch_descriptor] = directory
+
+
+class Watcher(object):
+
+    @classmethod
+    def watch(cls, sources: list, args: list) -> bool:
+        """Generates the configs matched by the provided sources, then again whenever they or the templates change
+
+        The process stays running between builds, so the template environment, compiled
+        templates and schema validators are only loaded once. Bursts of edits are
+        debounced into a single build, and a change to a config only rebuilds that config.
+
+        :param sources: paths to batch manifests, config files or glob patterns of config files
+        :param args: the command line options to pass to each generator, plus --poll and --debounce=ms
+        :return: if watching ended without errors
+        """
+        try:
+            jobs = BatchGenerator.collect_jobs(sources)
+        except Exception as exception:
+            print('Could not read the watched sources, aborting:\n\n%s' % str(exception))
+            return False
+
+        if len(jobs) == 0:
+            print('No configs matched the provided sources.')
+            return False
+
+        debounce = int(Generator.get_option(args, '--debounce', '300')) / 1000
+        observer = cls.__create_observer(
+            [os.path.abspath(config_path) for (generator, config_path) in jobs],
+            "--poll" in args
+        )
+
+        cls.__build(jobs, args)
+
+        print('\nWatching %d config(s) and %s for changes, press Ctrl+C to stop.' %
+              (len(jobs), config.TEMPLATE_DIR))
+
+        try:
+            while True:
+                changed_paths = observer.wait()
+
+                # Wait for the burst of edits to finish, e.g. an editor saving several files
+                while True:
+                    more_changed_paths = observer.wait(debounce)
+
+                    if len(more_changed_paths) == 0:
+                        break
+
+                    changed_paths |= more_changed_paths
+
+                cls.__build(cls.__get_affected_jobs(jobs, changed_paths), args)
+        except KeyboardInterrupt:
+            print('\nStopped watching.')
+
+        return True
+
+    @classmethod
+    def __get_affected_jobs(cls, jobs: list, changed_paths: set) -> list:
+        """Rebuilds every config when a template changes, otherwise only the changed configs
+
+        The generation manifest then skips the outputs whose inputs didn't change.
+        """
+        template_directory = os.path.abspath(config.TEMPLATE_DIR) + os.sep
+
+        if any(path.startswith(template_directory) for path in changed_paths):
+            return jobs
+
+        return [
+            [generator, config_path] for (generator, config_path) in jobs
+            if os.path.abspath(config_path) in changed_paths
+        ]
+
+    @classmethod
+    def __build(cls, jobs: list, args: list) -> None:
+        for (generator, config_path) in jobs:
+            print('\n[%s] %s' % (time.strftime('%H:%M:%S'), config_path))
+
+            # Report the timings of each build on their own
+            Profiler.reset()
+
+            generator.build(config_path, args)
+
+    @classmethod
+    def __create_observer(cls, config_paths: list, poll: bool):
+        if not poll:
+            try:
+                return InotifyObserver(config_paths, [config.TEMPLATE_DIR])
+            except (OSError, AttributeError):
+                # AttributeError is raised when the C library has no inotify functions
+                pass
+
+        return PollingObserver(config_paths, [config.TEMPLATE_DIR])
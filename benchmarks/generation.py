@@ -0,0 +1,292 @@
+"""Benchmarks module and page generation at increasing config sizes
+
+Usage: python3 benchmarks/generation.py [--runs=N] [--sizes=5,50,500] [--jobs=N] [--render-cache]
+                                        [--baseline=path] [--save-baseline] [--tolerance=0.25]
+
+Synthetic configs are built from the presets, scaled by the number of fields (and
+with it the media groups and conversions), and generated into a scratch project
+tree with stub formatter binaries. Reports throughput, per-stage latency and
+peak memory, and compares the median times against a stored baseline, exiting
+with a non-zero status if any scenario regressed by more than the tolerance.
+
+The render cache is disabled so that every run renders its templates, unless
+--render-cache is given to measure runs answered from a warm cache.
+"""
+import io
+import os
+import sys
+import copy
+import json
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT_DIR)
+
+from app import config as generator_config  # noqa: E402
+from app.generators import ModuleGenerator, PageGenerator  # noqa: E402
+from app.profiler import Profiler  # noqa: E402
+
+DEFAULT_BASELINE_PATH = os.path.join(ROOT_DIR, 'benchmarks', 'baseline.json')
+
+FIELD_TYPES = ['text', 'textarea', 'editor', 'date', 'media']
+
+# Files containing every marker tag the generators update
+PROJECT_FILES = {
+    'app/Providers/OptimusServiceProvider.php': '\n'.join([
+        '<?php',
+        '/*--OPTIMUS-CLI:imports--*/',
+        'class OptimusServiceProvider',
+        '{',
+        '    public function boot()',
+        '    {',
+        '        $linkableTypes = [/*--OPTIMUS-CLI:linkable-types--*/];',
+        '        $pageTemplates = [/*--OPTIMUS-CLI:page-templates--*/];',
+        '        /*--OPTIMUS-CLI:media-conversions--*/',
+        '    }',
+        '}',
+    ]),
+    'routes/admin.php': '<?php\n/*--OPTIMUS-CLI:routes--*/\n',
+    'resources/js/back/router/index.js': '/*--OPTIMUS-CLI:imports--*/\nexport default [\n/*--OPTIMUS-CLI:routes--*/\n];\n',
+    'resources/js/back/components/ui/Dashboard.vue': '<template>\n<div>\n<!--OPTIMUS-CLI:navigation-->\n</div>\n</template>\n',
+}
+
+FORMATTERS = ['prettier', 'php-cs-fixer', 'eslint']
+
+
+def get_option(name: str, default: str) -> str:
+    for arg in sys.argv[1:]:
+        if arg.startswith(name + '='):
+            return arg[len(name) + 1:]
+
+    return default
+
+
+def load_preset(file_name: str) -> dict:
+    with open(os.path.join(ROOT_DIR, 'presets', file_name), 'r') as preset_file:
+        return json.loads(preset_file.read())
+
+
+def build_fields(template_field: dict, size: int) -> list:
+    """Builds the given number of fields, cycling through every field type"""
+    fields = []
+
+    for index in range(size):
+        field = copy.deepcopy(template_field)
+        field['type'] = FIELD_TYPES[index % len(FIELD_TYPES)]
+        field['name'] = 'field_%d' % index
+        field['label'] = 'Field %d' % index
+        field['show_on_admin_index'] = index % 10 == 0
+
+        if field['type'] == 'media':
+            field['options'] = {
+                'media_group': 'group_%d' % index,
+                'conversions': ['conversion_%d' % (index % max(1, size // 10))],
+            }
+        else:
+            field['options'] = {}
+
+        fields.append(field)
+
+    return fields
+
+
+def build_conversions(size: int) -> list:
+    return [
+        {'name': 'conversion_%d' % index, 'width': 100 + index, 'height': 100 + index}
+        for index in range(max(1, size // 10))
+    ]
+
+
+def build_module_config(size: int) -> dict:
+    config = load_preset('module.json')
+    config['fields'] = build_fields(config['fields'][0], size)
+
+    for feature in config['features']:
+        if feature['type'] == 'media':
+            feature['options']['media_groups'] = [
+                {'name': field['options']['media_group'], 'conversions': field['options']['conversions']}
+                for field in config['fields'] if field['type'] == 'media'
+            ]
+
+            feature['options']['conversions'] = build_conversions(size)
+
+    return config
+
+
+def build_page_config(size: int) -> dict:
+    config = load_preset('page_template.json')
+    config['fields'] = build_fields(config['fields'][0], size)
+    config['conversions'] = build_conversions(size)
+
+    return config
+
+
+def create_project(root_directory: str) -> str:
+    project_directory = tempfile.mkdtemp(dir=root_directory)
+
+    for (file_path, contents) in PROJECT_FILES.items():
+        os.makedirs(os.path.dirname(os.path.join(project_directory, file_path)), exist_ok=True)
+
+        with open(os.path.join(project_directory, file_path), 'w') as project_file:
+            project_file.write(contents)
+
+    return project_directory
+
+
+def install_stub_formatters(root_directory: str) -> None:
+    """Puts formatters which exit immediately at the front of the PATH"""
+    bin_directory = os.path.join(root_directory, 'bin')
+    os.makedirs(bin_directory)
+
+    for formatter in FORMATTERS:
+        stub_path = os.path.join(bin_directory, formatter)
+
+        with open(stub_path, 'w') as stub_file:
+            stub_file.write('#!/bin/sh\nexit 0\n')
+
+        os.chmod(stub_path, 0o755)
+
+    os.environ['PATH'] = bin_directory + os.pathsep + os.environ.get('PATH', '')
+
+
+def generate(generator, config: dict, root_directory: str, args: list) -> float:
+    """Generates the config into a fresh project, returning the elapsed seconds"""
+    project_directory = create_project(root_directory)
+    previous_directory = os.getcwd()
+
+    os.chdir(project_directory)
+
+    try:
+        started_at = time.perf_counter()
+
+        with redirect_stdout(io.StringIO()):
+            success = generator.build_config(copy.deepcopy(config), args)
+
+        elapsed = time.perf_counter() - started_at
+    finally:
+        os.chdir(previous_directory)
+        shutil.rmtree(project_directory)
+
+    if not success:
+        raise(Exception('Generation failed for %s' % generator.__name__))
+
+    return elapsed
+
+
+def run_scenario(generator, config: dict, root_directory: str, runs: int, args: list) -> dict:
+    # Warm the template environment so every timed run is comparable
+    generate(generator, config, root_directory, args)
+
+    Profiler.reset()
+
+    timings = [generate(generator, config, root_directory, args) for _ in range(runs)]
+
+    stages = {}
+
+    for stage in Profiler.get_results()['stages']:
+        stages[stage['stage']] = round(stage['total_ms'] / runs, 3)
+
+    tracemalloc.start()
+    generate(generator, config, root_directory, args)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    median = statistics.median(timings)
+
+    return {
+        'median_ms': round(median * 1000, 3),
+        'fields_per_second': round(len(config['fields']) / median, 1),
+        'peak_memory_kb': round(peak_memory / 1024, 1),
+        'stages_ms': stages,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns the names of the scenarios which are slower than the baseline by more than the tolerance"""
+    regressions = []
+
+    print('\n%-20s %12s %12s %8s' % ('scenario', 'baseline ms', 'median ms', 'change'))
+
+    for (name, result) in results.items():
+        if name not in baseline:
+            continue
+
+        change = result['median_ms'] / baseline[name]['median_ms'] - 1
+
+        print('%-20s %12.1f %12.1f %+7.0f%%' % (
+            name, baseline[name]['median_ms'], result['median_ms'], change * 100
+        ))
+
+        if change > tolerance:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    runs = int(get_option('--runs', '5'))
+    sizes = [int(size) for size in get_option('--sizes', '5,50,500,2000').split(',')]
+    baseline_path = get_option('--baseline', DEFAULT_BASELINE_PATH)
+    tolerance = float(get_option('--tolerance', '0.25'))
+
+    args = ['--jobs=%s' % get_option('--jobs', '1')]
+
+    if '--render-cache' not in sys.argv:
+        generator_config.RENDER_CACHE_SIZE = 0
+
+    root_directory = tempfile.mkdtemp(prefix='optimus-cli-benchmark-')
+    install_stub_formatters(root_directory)
+
+    results = {}
+
+    try:
+        print('%-20s %12s %14s %14s' % ('scenario', 'median ms', 'fields/s', 'peak memory kb'))
+
+        for size in sizes:
+            for (kind, generator, config) in [
+                ('module', ModuleGenerator, build_module_config(size)),
+                ('page', PageGenerator, build_page_config(size)),
+            ]:
+                name = '%s-%d' % (kind, size)
+                results[name] = run_scenario(generator, config, root_directory, runs, args)
+
+                print('%-20s %12.1f %14.1f %14.1f' % (
+                    name,
+                    results[name]['median_ms'],
+                    results[name]['fields_per_second'],
+                    results[name]['peak_memory_kb'],
+                ))
+    finally:
+        shutil.rmtree(root_directory)
+
+    print('\nSlowest stages (ms per run):')
+
+    for (name, result) in results.items():
+        slowest = sorted(result['stages_ms'].items(), key=lambda stage: -stage[1])[:3]
+        print('%-20s %s' % (name, ', '.join('%s %.1f' % stage for stage in slowest)))
+
+    if '--save-baseline' in sys.argv:
+        with open(baseline_path, 'w') as baseline_file:
+            baseline_file.write(json.dumps(results, indent=2, sort_keys=True))
+
+        return print('\nSaved baseline to %s' % baseline_path)
+
+    if not os.path.isfile(baseline_path):
+        return print('\nNo baseline found at %s, run with --save-baseline to store one' % baseline_path)
+
+    with open(baseline_path, 'r') as baseline_file:
+        regressions = compare(results, json.loads(baseline_file.read()), tolerance)
+
+    if len(regressions) > 0:
+        print('\nRegressed by more than %d%%: %s' % (tolerance * 100, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
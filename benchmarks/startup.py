@@ -0,0 +1,106 @@
+"""Measures the cold start time of the CLI when no generator needs to run
+
+Usage: python3 benchmarks/startup.py [--runs=N] [--max-ms=N]
+
+Exits with a non-zero status if the median start time exceeds --max-ms, or if
+any of the heavy template and schema dependencies are imported before a command
+is dispatched.
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CLI_PATH = os.path.join(ROOT_DIR, 'cli.py')
+
+# Invocations which should be rejected before any generator is loaded
+SCENARIOS = [
+    ['no arguments', []],
+    ['unknown command', ['generate:nothing']],
+    ['missing argument', ['generate:module']],
+]
+
+HEAVY_MODULES = ['jinja2', 'jsonschema', 'inflection', 'app.generators']
+
+IMPORT_CHECK = '''
+import sys, json
+heavy_modules = json.loads(sys.argv[2])
+sys.argv = ['cli.py'] + json.loads(sys.argv[1])
+import cli
+cli.main()
+print(json.dumps([name for name in heavy_modules if name in sys.modules]))
+'''
+
+
+def get_option(name: str, default: str) -> str:
+    for arg in sys.argv[1:]:
+        if arg.startswith(name + '='):
+            return arg[len(name) + 1:]
+
+    return default
+
+
+def time_command(command: list, runs: int) -> float:
+    """Returns the median wall time in milliseconds of running the provided command"""
+    timings = []
+
+    for _ in range(runs):
+        started_at = time.perf_counter()
+
+        subprocess.run(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        timings.append((time.perf_counter() - started_at) * 1000)
+
+    return statistics.median(timings)
+
+
+def find_heavy_imports(arguments: list) -> list:
+    """Returns the heavy modules imported while dispatching the provided arguments"""
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_CHECK, json.dumps(arguments), json.dumps(HEAVY_MODULES)],
+        cwd=ROOT_DIR,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(get_option('--runs', '10'))
+    max_ms = get_option('--max-ms', None)
+
+    failed = False
+
+    print('%-20s %10s' % ('scenario', 'median ms'))
+
+    # Time a bare interpreter so the CLI's own overhead can be seen
+    print('%-20s %10.1f' % ('bare interpreter', time_command([sys.executable, '-c', 'pass'], runs)))
+
+    for (name, arguments) in SCENARIOS:
+        median_ms = time_command([sys.executable, CLI_PATH] + arguments, runs)
+        heavy_imports = find_heavy_imports(arguments)
+
+        print('%-20s %10.1f' % (name, median_ms))
+
+        if len(heavy_imports) > 0:
+            print('  imported before dispatch: %s' % ', '.join(heavy_imports))
+            failed = True
+
+        if max_ms is not None and median_ms > float(max_ms):
+            print('  exceeds the %sms budget' % max_ms)
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
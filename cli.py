@@ -1,4 +1,5 @@
 import sys
+import importlib
 from app import config
 
 ARGUMENTS = sys.argv[1:]
@@ -28,7 +29,14 @@ def main():
         )
 
     # Execute the command callback with the provided arguments
-    command['callback'](ARGUMENTS)
+    command['callback'](resolve_handler(command['handler']), ARGUMENTS)
+
+
+def resolve_handler(handler: str):
+    """Imports the handler of a command, given in the form "module:attribute" """
+    (module_name, attribute_name) = handler.split(':')
+
+    return getattr(importlib.import_module(module_name), attribute_name)
 
 
 if __name__ == '__main__':